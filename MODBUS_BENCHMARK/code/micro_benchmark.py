@@ -0,0 +1,162 @@
+"""
+#title           :micro_benchmark.py
+#description     :microbenchmarks of the functions of the node engine that run on every poll (planning, decoding, storing)
+#author          :Nicholas Putra Rihandoko
+#date            :2026/10/18
+#version         :0.1
+#usage           :python3 micro_benchmark.py [--pin 0] [--reference 1.9] [--record frames.json | --payload frames.json] [--output micro.json]
+#notes           :the functions are fed with register payloads of a full read (e.g. all 16 modules of the Kyuden battery),
+#                 generated by the MODBUS_SIMULATOR register image or loaded from a recorded file
+#python_version  :3.7.3
+#==============================================================================
+"""
+
+import os
+import sys
+import json
+import time
+import timeit
+import random
+import platform
+import subprocess
+
+# Repository root
+root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(root, "MODBUS_SIMULATOR", "code"))
+import modbus_simulator
+
+# Read request of each benchmarked node: (library, increment, shift, read address), as in the example projects
+cases = {
+    "kyuden_battery": ("kyuden_battery_72kWh", 1, 0,
+                       ["Cell_Voltage_M1","Cell_Voltage_M2","Cell_Voltage_M3","Cell_Voltage_M4","Cell_Voltage_M5","Cell_Voltage_M6","Cell_Voltage_M7","Cell_Voltage_M8",
+                        "Cell_Voltage_M9","Cell_Voltage_M10","Cell_Voltage_M11","Cell_Voltage_M12","Cell_Voltage_M13","Cell_Voltage_M14","Cell_Voltage_M15","Cell_Voltage_M16",
+                        "Module_Temperature", "SOC","Total_Voltage"]),
+    "yaskawa_D1000": ("yaskawa_D1000", 1, 0,
+                      ["DC_Voltage_Command","AC_Voltage","AC_Current","DC_Power","AC_Frequency","Power_Factor","AC_Power","Consumed_Power_kWh","Produced_Power_kWh"]),
+    "omron_KMN1FLK": ("omron_KMN1FLK", 2, 0, ["Voltage_1",0x0208]),
+}
+
+def calibrate(loops=200000):
+    # Time (in seconds) of a fixed pure-Python workload, run on the target device to get its speed ratio
+    start = time.perf_counter()
+    total = 0
+    for i in range(loops): total += (i * 3) % 7
+    return time.perf_counter() - start
+
+def setup_case(name,payload=None):
+    # Node (without a client), its read plan and the register payload of each read block
+    library, increment, shift, address = cases[name]
+    node = modbus_simulator.load_device(library).node(unit=1, name=name, client=None, increment=increment, shift=shift)
+    address = node.normalize_address(address)
+    plan = node.get_read_plan(None, address)
+    if payload is None:
+        random.seed(0)
+        image = modbus_simulator.DeviceImage(modbus_simulator.load_device(library), 1, increment=increment, shift=shift)
+        payload = [image.read(fc, start, count) for fc, start, count, decoder in plan.blocks]
+    # The address given to count_address, once the calculated and "compile" parameters are expanded
+    expanded = []
+    for a in address:
+        k = node._extra_index.get(a)
+        if k is None: expanded.append(a)
+        else: expanded.extend(node.handle_dependency(node._extra_calc[k].get("compile") or [k]))
+    compile = [value["compile"] for value in node._extra_calc.values() if value.get("compile") is not None]
+    return node, address, plan, payload, expanded, compile
+
+def benchmarks(name,payload=None):
+    # {function: callable} of one case, each call is the work of one poll of the case
+    node, address, plan, payload, expanded, compile = setup_case(name, payload)
+    blocks = list(zip(plan.blocks, payload))
+    footprint = sorted(set(int(n[2:],16) if n.startswith('Hx') else node._memory_dict[n]["address"] for b in plan.blocks for n in b[3].names))
+    def plan_read():
+        node._read_plan.clear()
+        node.get_read_plan(None, address)
+    def decode():
+        for (fc, start, count, decoder), registers in blocks: decoder.decode(registers)
+    def save_read():
+        for (fc, start, count, decoder), registers in blocks: node.save_read(registers, decoder)
+    save_read()
+    node.handle_extra_calculation()
+    functions = {"count_address": lambda: node.count_address(None, expanded),
+                 "plan_blocks": lambda: node.plan_blocks(footprint),
+                 "get_read_plan (compile)": plan_read,
+                 "get_read_plan (cached)": lambda: node.get_read_plan(None, address),
+                 "handle_dependency": lambda: node.handle_dependency(compile),
+                 "decode (handle_sign)": decode,
+                 "save_read": save_read,
+                 "handle_extra_calculation": node.handle_extra_calculation,
+                 "get_read_attr": node.get_read_attr,
+                 "snapshot": node.snapshot}
+    try:
+        # query needs pymysql
+        sys.path.insert(0, os.path.join(root, "_example_projects", "ems", "modbus_code"))
+        import query
+        values = [value for key, value in node.get_read_attr()]
+        functions["query.strval"] = lambda: [query.strval(v) for v in values if isinstance(v, list)]
+    except ImportError as e: print(" -- query.strval is skipped ({}) --".format(e))
+    return functions, {"blocks": len(plan.blocks), "registers": sum(b[2] for b in plan.blocks), "fields": len(expanded)}
+
+def measure(function,repeat=5,target=0.2):
+    # Best time of one call (in seconds) over 'repeat' runs, each run as many calls as fit in 'target' seconds
+    timer = timeit.Timer(function)
+    number, elapsed = timer.autorange()
+    number = max(1, int(number * target / max(elapsed, 1e-9)))
+    return min(timer.repeat(repeat, number)) / number
+
+def version():
+    try: return subprocess.check_output(["git", "-C", root, "describe", "--always", "--dirty"], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception: return None
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Microbenchmarks of the node engine functions that run on every poll")
+    parser.add_argument("--case", default="all", choices=["all"] + list(cases))
+    parser.add_argument("--repeat", type=int, default=5, help="runs of each function, the best one is kept")
+    parser.add_argument("--target", type=float, default=0.2, help="duration of each run (in seconds)")
+    parser.add_argument("--pin", type=int, default=None, help="run on this CPU core only")
+    parser.add_argument("--scale", type=float, default=None, help="slowdown factor of the target CPU, e.g. 8 for a Pi-class CPU")
+    parser.add_argument("--reference", type=float, default=None, help="calibration time measured on the target CPU (see --calibrate), sets --scale")
+    parser.add_argument("--calibrate", action="store_true", help="print the calibration time of this CPU and exit")
+    parser.add_argument("--record", default=None, help="save the register payloads of the cases to this JSON file")
+    parser.add_argument("--payload", default=None, help="JSON file of recorded register payloads")
+    parser.add_argument("--output", default=None, help="JSON file of the results")
+    parser.add_argument("--compare", default=None, help="JSON file of previous results")
+    args = parser.parse_args()
+
+    if args.pin is not None: os.sched_setaffinity(0, {args.pin})
+    local = min(calibrate() for _ in range(5))
+    if args.calibrate:
+        print("{:.4f}".format(local)); sys.exit(0)
+    scale = args.reference / local if args.reference else (args.scale or 1)
+    names = list(cases) if args.case == "all" else [args.case]
+
+    payloads = {}
+    if args.payload:
+        with open(args.payload) as file: payloads = json.load(file)
+    if args.record:
+        for name in names: payloads[name] = setup_case(name)[3]
+        with open(args.record, "w") as file: json.dump(payloads, file)
+        print(" -- register payloads are saved to {} --".format(args.record))
+
+    results = {"version": version(), "date": time.strftime("%Y-%m-%d %H:%M:%S"), "python": platform.python_version(),
+               "machine": platform.machine(), "processor": platform.processor(), "pin": args.pin,
+               "calibration": local, "scale": scale, "cases": {}}
+    for name in names:
+        functions, info = benchmarks(name, payloads.get(name))
+        print("{} ({} blocks, {} registers, {} fields), in us per poll{}".format(name, info["blocks"], info["registers"], info["fields"],
+                                                                                 " x {:.1f}".format(scale) if scale != 1 else ""))
+        times = {}
+        for function, call in functions.items():
+            times[function] = measure(call, args.repeat, args.target) * scale
+            print("{:<28}: {:10.1f}".format(function, 1e6*times[function]))
+        print("")
+        results["cases"][name] = dict(info, times=times)
+    if args.output:
+        with open(args.output, "w") as file: json.dump(results, file, indent=2)
+    if args.compare:
+        # Ratio new/old of each function (> 1 is slower), both scaled to the target CPU
+        with open(args.compare) as file: old = json.load(file)
+        for name, case in results["cases"].items():
+            base = old.get("cases", {}).get(name, {}).get("times", {})
+            print(" -- {} ({} vs {}) --".format(name, results["version"], old.get("version")))
+            for function, t in case["times"].items():
+                if base.get(function): print("{:<28}: {:.3f}".format(function, t / base[function]))
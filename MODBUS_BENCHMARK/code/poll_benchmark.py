@@ -0,0 +1,303 @@
+"""
+#title           :poll_benchmark.py
+#description     :benchmark of the polling cycle (read_modbus) of the example projects over the simulated Modbus bus
+#author          :Nicholas Putra Rihandoko
+#date            :2026/10/18
+#version         :0.1
+#usage           :python3 poll_benchmark.py --project all --output poll.json [--compare poll_old.json]
+#notes           :the real node classes of each project read a MODBUS_SIMULATOR slave (one per bus) served by another process,
+#                 so the CPU time measured is the one of the polling side only
+#python_version  :3.7.3
+#==============================================================================
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import importlib
+import subprocess
+import multiprocessing
+
+# Repository root
+root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(root, "MODBUS_SIMULATOR", "code"))
+import modbus_simulator
+
+# Nodes and read address of each example project, as in setup_modbus() and setup_schedule() of its main__modbus.py:
+# nodes are (library, unit, name, bus, increment, shift), the nodes of the same bus share one serial port
+projects = {
+    "ems": {"baudrate": 9600, "delay": 300,
+            "nodes": [("omron_KMN1FLK", 3, "OMRON CT1", 0, 2, 0),
+                      ("omron_KMN1FLK", 2, "OMRON CT2", 0, 2, 0),
+                      ("msystem_M5XWTU113", 1, "MSYSTEM", 0, 2, 2)],
+            "addr": [["Voltage_1",0x0208],
+                     [0x0000],
+                     ["voltage"]]},
+    "kyuden_soc": {"baudrate": 9600, "delay": 100,
+            "nodes": [("kyuden_battery_72kWh", 1, "BATTERY", 1, 1, 0),
+                      ("yaskawa_D1000", 2, "CONVERTER", 0, 1, 0),
+                      ("yaskawa_GA500", 3, "INVERTER", 0, 1, 0)],
+            "addr": [["Cell_Voltage_M1","Cell_Voltage_M2","Cell_Voltage_M3","Cell_Voltage_M4","Cell_Voltage_M5","Cell_Voltage_M6","Cell_Voltage_M7","Cell_Voltage_M8",
+                      "Cell_Voltage_M9","Cell_Voltage_M10","Cell_Voltage_M11","Cell_Voltage_M12","Cell_Voltage_M13","Cell_Voltage_M14","Cell_Voltage_M15","Cell_Voltage_M16",
+                      "Module_Temperature", "SOC","Total_Voltage"],
+                     ["DC_Current"],["DC_Current","AC_Power"]]},
+    "n-ePower": {"baudrate": 9600, "delay": 100,
+            "nodes": [("kyuden_battery_72kWh", 1, "BATTERY", 1, 1, 0),
+                      ("yaskawa_D1000", 2, "CONVERTER", 0, 1, 0),
+                      ("yaskawa_GA500", 3, "INVERTER", 0, 1, 0)],
+            "addr": [["SOC","Total_Voltage","Cell_Voltage_avg","Temperature_avg"],
+                     ["DC_Voltage_Command","AC_Voltage","AC_Current","DC_Power","AC_Frequency","Power_Factor","AC_Power","Consumed_Power_kWh","Produced_Power_kWh"],
+                     ["Output_Frequency","Output_Current","Output_Voltage","AC_Power"]]},
+}
+
+def project_path(project):
+    return os.path.join(root, "_example_projects", project, "modbus_code")
+
+def load_library(project,name):
+    # Device library of the project (lib/<name>.py), so the benchmark runs the code the project ships
+    path = project_path(project)
+    if path not in sys.path: sys.path.insert(0, path)
+    return importlib.import_module("lib." + name)
+
+def serve(project,bus,transport,latency,baudrate,errors,pipe):
+    # Simulator process of one bus, sends back the port to connect to and serves until the pipe is closed
+    config = projects[project]
+    devices = [modbus_simulator.DeviceImage(load_library(project, lib), unit, increment=inc, shift=shift)
+               for lib, unit, name, b, inc, shift in config["nodes"] if b == bus]
+    simulator = modbus_simulator.Simulator(devices, latency, baudrate, errors)
+    pipe.send(simulator.start_tcp(port=0, framer="rtu") if transport == "tcp" else simulator.start_pty())
+    try: pipe.recv()
+    except EOFError: pass
+    pipe.send(simulator.stats)
+    simulator.stop()
+
+def make_client(transport,port,baudrate,timeout=1):
+    # pymodbus client of the project (Modbus RTU frames over the pseudo-terminal or TCP)
+    from pymodbus.client.sync import ModbusSerialClient, ModbusTcpClient
+    from pymodbus.transaction import ModbusRtuFramer
+    if transport == "tcp": client = ModbusTcpClient("127.0.0.1", port=port, framer=ModbusRtuFramer, timeout=timeout)
+    else: client = ModbusSerialClient(method="rtu", port=port, baudrate=baudrate, stopbits=1, bytesize=8, parity="N", timeout=timeout)
+    client.connect()
+    return client
+
+class MeteredClient:
+    # Wraps the client of one bus: time spent in the commands (serial I/O and pymodbus framing), frames, bytes on
+    # the wire (Modbus RTU: 8 bytes per read request, 5 + 2 per register per response) and registers read
+    def __init__(self,client):
+        self._client = client
+        self.reset()
+
+    def reset(self):
+        self.io, self.frames, self.bytes, self.registers, self.errors = 0, 0, 0, 0, 0
+
+    def __getattr__(self,name):
+        return getattr(self._client, name)
+
+    def command(self,method,request,**kwargs):
+        start = time.perf_counter()
+        try: response = method(**kwargs)
+        finally: self.io += time.perf_counter() - start
+        self.frames += 1
+        self.bytes += request
+        if response.isError():
+            self.errors += 1
+            if hasattr(response, "exception_code"): self.bytes += 5
+        else:
+            registers = len(getattr(response, "registers", None) or [])
+            self.registers += registers
+            self.bytes += 5 + 2*registers
+        return response
+
+    def read_holding_registers(self,address,count,**kwargs):
+        return self.command(self._client.read_holding_registers, 8, address=address, count=count, **kwargs)
+
+    def read_input_registers(self,address,count,**kwargs):
+        return self.command(self._client.read_input_registers, 8, address=address, count=count, **kwargs)
+
+class Meter:
+    # Time spent by the nodes in the pacing sleeps (the time module of modbus_node is swapped for this one) and
+    # in decoding (save_read and handle_extra_calculation of each node)
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.slept, self.decode = 0, 0
+
+    def __getattr__(self,name):
+        return getattr(time, name)
+
+    def timed(self,method):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try: return method(*args, **kwargs)
+            finally: self.decode += time.perf_counter() - start
+        return wrapper
+
+    def patch(self,node):
+        node.save_read = self.timed(node.save_read)
+        node.handle_extra_calculation = self.timed(node.handle_extra_calculation)
+
+    def sleep(self,seconds):
+        start = time.perf_counter()
+        time.sleep(seconds)
+        self.slept += time.perf_counter() - start
+
+def summary(values):
+    values = sorted(values)
+    if not values: return {}
+    return {"mean": sum(values)/len(values), "p50": values[len(values)//2],
+            "p95": values[min(len(values)-1, int(0.95*len(values)))], "max": values[-1]}
+
+def run_project(project,cycles=50,warmup=20,transport="pty",latency=[0.005,0.02],baudrate=None,errors=None,sweep=True):
+    config = projects[project]
+    baudrate = baudrate or config["baudrate"]
+    sys.path.insert(0, project_path(project))
+    import poller
+    engine = load_library(project, "modbus_node")
+    meter = Meter()
+    engine.time = meter
+    # One simulator process and one client per bus
+    buses = sorted(set(n[3] for n in config["nodes"]))
+    processes, pipes, clients, report = [], {}, {}, None
+    for bus in buses:
+        pipe, child = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=serve, args=(project, bus, transport, latency, baudrate, errors, child), daemon=True)
+        process.start()
+        processes.append(process); pipes[bus] = pipe
+        clients[bus] = MeteredClient(make_client(transport, pipe.recv(), baudrate))
+    try:
+        server = []
+        for lib, unit, name, bus, inc, shift in config["nodes"]:
+            node = load_library(project, lib).node(unit=unit, name=name, client=clients[bus], delay=config["delay"],
+                                                   max_count=20, increment=inc, shift=shift, baudrate=baudrate)
+            meter.patch(node)
+            server.append(node)
+        bus = poller.BusPoller(server)
+        for _ in range(warmup): bus.read(config["addr"])
+        result = {"cycles": cycles, "cycle_time": [], "io_time": [], "sleep_time": [], "decode_time": [], "cpu_time": [],
+                  "frames": [], "bytes": [], "registers": [], "errors": 0}
+        for _ in range(cycles):
+            meter.reset()
+            for client in clients.values(): client.reset()
+            cpu = time.process_time()
+            bus.read(config["addr"])
+            result["cpu_time"].append(time.process_time() - cpu)
+            result["cycle_time"].append(bus.cycle_time)
+            result["io_time"].append(sum(c.io for c in clients.values()))
+            result["sleep_time"].append(meter.slept)
+            result["decode_time"].append(meter.decode)
+            result["frames"].append(sum(c.frames for c in clients.values()))
+            result["bytes"].append(sum(c.bytes for c in clients.values()))
+            result["registers"].append(sum(c.registers for c in clients.values()))
+            result["errors"] += sum(c.errors for c in clients.values())
+        registers = sum(result["registers"])
+        report = {"buses": len(buses), "baudrate": baudrate, "cycles": cycles, "errors": result["errors"],
+                  "cycle_time": summary(result["cycle_time"]),
+                  # io and sleep are summed over the buses, which are read at the same time
+                  "io_time": summary(result["io_time"]), "sleep_time": summary(result["sleep_time"]),
+                  "decode_time": summary(result["decode_time"]), "cpu_time": summary(result["cpu_time"]),
+                  "frames_per_cycle": sum(result["frames"]) / cycles, "bytes_per_cycle": sum(result["bytes"]) / cycles,
+                  "registers_per_cycle": registers / cycles,
+                  "cpu_per_register": sum(result["cpu_time"]) / registers if registers else None,
+                  "decode_per_register": sum(result["decode_time"]) / registers if registers else None,
+                  "pacing": bus.pacing}
+        if sweep: report["sweep"] = run_sweep(server[0], clients[config["nodes"][0][3]], meter, max(cycles // 5, 3))
+        bus.close()
+        return report
+    finally:
+        # Counters of the simulator of each bus
+        stats = []
+        for pipe in pipes.values():
+            try:
+                pipe.send("stop")
+                stats.append(pipe.recv())
+            except (EOFError, OSError): pass
+        for process in processes: process.join(5)
+        if report is not None: report["simulator"] = stats
+
+def run_sweep(node,client,meter,cycles):
+    # Cycle of the first node alone, reading its first 1, 2, 4 ... fields (by address) of its first function code
+    fields = sorted((value["address"], key) for key, value in node._memory_dict.items() if value["fc"] in (0x03, 0x04))
+    fc = node._memory_dict[fields[0][1]]["fc"]
+    fields = [key for a, key in fields if node._memory_dict[key]["fc"] == fc]
+    counts, k = [], 1
+    while k < len(fields): counts.append(k); k *= 2
+    counts.append(len(fields))
+    sweep = []
+    for k in counts:
+        address = fields[:k]
+        node.read(address)
+        cycle, cpu, decode = [], [], 0
+        client.reset(); meter.reset()
+        for _ in range(cycles):
+            start, c = time.perf_counter(), time.process_time()
+            node.read(address)
+            cycle.append(time.perf_counter() - start); cpu.append(time.process_time() - c)
+        sweep.append({"fields": k, "frames_per_cycle": client.frames / cycles, "registers_per_cycle": client.registers / cycles,
+                      "cycle_time": summary(cycle)["mean"], "cpu_time": summary(cpu)["mean"], "decode_time": meter.decode / cycles})
+    return sweep
+
+def version():
+    try: return subprocess.check_output(["git", "-C", root, "describe", "--always", "--dirty"], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception: return None
+
+def compare(new,old):
+    # Print the ratio new/old of the main metrics of each project (> 1 is slower)
+    for project, report in new["projects"].items():
+        base = old.get("projects", {}).get(project)
+        if base is None: continue
+        print(" -- {} ({} vs {}) --".format(project, new.get("version"), old.get("version")))
+        for key in ("cycle_time", "io_time", "sleep_time", "decode_time", "cpu_time"):
+            if base[key].get("mean"): print("{:<20}: {:.3f}".format(key, report[key]["mean"] / base[key]["mean"]))
+        for key in ("frames_per_cycle", "bytes_per_cycle", "cpu_per_register"):
+            if base.get(key): print("{:<20}: {:.3f}".format(key, report[key] / base[key]))
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Polling cycle benchmark of the example projects over the Modbus simulator")
+    parser.add_argument("--project", default="all", choices=["all"] + list(projects))
+    parser.add_argument("--cycles", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=20, help="cycles before measuring (the pacing margin is learned)")
+    parser.add_argument("--transport", default="pty", choices=["pty", "tcp"])
+    parser.add_argument("--baudrate", type=int, default=None, help="emulated serial speed (default: the project's)")
+    parser.add_argument("--latency", type=float, nargs=2, default=[0.005, 0.02], help="turnaround time of a slave [min max] (in seconds)")
+    parser.add_argument("--timeout", type=float, default=0, help="probability of no response")
+    parser.add_argument("--no-sweep", action="store_true", help="skip the field count sweep")
+    parser.add_argument("--output", default=None, help="JSON file of the results")
+    parser.add_argument("--compare", default=None, help="JSON file of previous results")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # One project per process, the projects have modules of the same name (lib, poller)
+        report = run_project(args.project, args.cycles, args.warmup, args.transport, args.latency, args.baudrate,
+                             {"timeout": args.timeout}, not args.no_sweep)
+        print(json.dumps(report))
+        sys.exit(0)
+
+    results = {"version": version(), "date": time.strftime("%Y-%m-%d %H:%M:%S"), "python": platform.python_version(),
+               "machine": platform.machine(), "processor": platform.processor(), "settings": vars(args), "projects": {}}
+    for project in list(projects) if args.project == "all" else [args.project]:
+        command = [sys.executable, os.path.abspath(__file__), "--child", "--project", project, "--cycles", str(args.cycles),
+                   "--warmup", str(args.warmup), "--transport", args.transport, "--timeout", str(args.timeout),
+                   "--latency"] + [str(l) for l in args.latency]
+        if args.baudrate: command += ["--baudrate", str(args.baudrate)]
+        if args.no_sweep: command.append("--no-sweep")
+        output = subprocess.run(command, stdout=subprocess.PIPE, universal_newlines=True).stdout
+        try: report = json.loads(output.strip().splitlines()[-1])
+        except (ValueError, IndexError):
+            print("problem with", project, ":")
+            print(output)
+            print("<===== ===== continuing ===== =====>")
+            print("")
+            continue
+        results["projects"][project] = report
+        print("{:<12}: {:.1f} ms per cycle ({:.1f} ms I/O, {:.1f} ms sleep, {:.2f} ms decode), {:.1f} frames, {:.0f} bytes, {:.1f} us CPU per register".format(
+            project, 1000*report["cycle_time"]["mean"], 1000*report["io_time"]["mean"], 1000*report["sleep_time"]["mean"],
+            1000*report["decode_time"]["mean"], report["frames_per_cycle"], report["bytes_per_cycle"], 1e6*(report["cpu_per_register"] or 0)))
+    if args.output:
+        with open(args.output, "w") as file: json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file: compare(results, json.load(file))
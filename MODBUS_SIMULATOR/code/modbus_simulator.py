@@ -0,0 +1,351 @@
+"""
+#title           :modbus_simulator.py
+#description     :Modbus RTU/TCP slave simulator of the device libraries, for testing and benchmarking without RS-485 hardware
+#author          :Nicholas Putra Rihandoko
+#date            :2026/10/18
+#version         :0.1
+#usage           :python3 modbus_simulator.py --device omron_KMN1FLK:3:increment=2 --device omron_KMN1FLK:2:increment=2 --pty
+#notes           :the register image of each slave is built from the memory_dict of its device library (with the same
+#                 increment/shift as the node), the client connects to the printed pseudo-terminal or TCP port
+#python_version  :3.7.3
+#==============================================================================
+"""
+
+import os
+import sys
+import re
+import glob
+import math
+import time
+import random
+import select
+import socket
+import struct
+import threading
+import importlib
+import tty
+
+# Repository root (the device libraries are in <root>/<DEVICE>/code, the engine in <root>/MODBUS_NODE/code)
+root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Modbus exception codes
+ILLEGAL_FUNCTION, ILLEGAL_ADDRESS, ILLEGAL_VALUE, DEVICE_FAILURE = 1, 2, 3, 4
+
+def crc16(frame):
+    # Modbus RTU CRC (polynomial 0xA001), sent low byte first
+    crc = 0xFFFF
+    for byte in frame:
+        crc = (crc >> 8) ^ CRC_TABLE[(crc ^ byte) & 0xFF]
+    return crc
+
+def crc_table():
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8): crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+CRC_TABLE = crc_table()
+
+def load_device(name,path=None):
+    # Import a device library by module name, e.g. "omron_KMN1FLK", from <root>/*/code or the given directory
+    for directory in [path] if path else [os.path.join(root, "MODBUS_NODE", "code")] + sorted(glob.glob(os.path.join(root, "*", "code"))):
+        if directory not in sys.path: sys.path.append(directory)
+    return importlib.import_module(name)
+
+class Waveform:
+    # Value of a simulated field over time (in the engineering unit of the register map):
+    # mean + amplitude * sin(2*pi*t/period) + ramp * (time since start) + gaussian noise
+    def __init__(self,mean=0,amplitude=0,period=600,noise=0,ramp=0):
+        self.mean = mean
+        self.amplitude = amplitude
+        self.period = period    # in seconds
+        self.noise = noise      # standard deviation
+        self.ramp = ramp        # per second, e.g. an energy counter
+        self.phase = random.random() * period
+        self._start = time.time()
+
+    def value(self,t):
+        val = self.mean + self.ramp * (t - self._start)
+        if self.amplitude: val += self.amplitude * math.sin(2 * math.pi * (t + self.phase) / self.period)
+        if self.noise: val += random.gauss(0, self.noise)
+        return val
+
+# Default waveform by field name (first match), the value is clipped to what the register can hold
+profiles = [
+    (r"_m\d+_c\d+|cell",            lambda: Waveform(3.3, 0.05, 1800, 0.002)),
+    (r"soc",                        lambda: Waveform(60, 20, 3600)),
+    (r"temp",                       lambda: Waveform(30, 3, 1800, 0.1)),
+    (r"freq",                       lambda: Waveform(50, 0.05, 60, 0.01)),
+    (r"factor|pf",                  lambda: Waveform(0.95, 0.03, 300, 0.005)),
+    (r"kwh|wh|energy|consumed|produced", lambda: Waveform(1000, ramp=0.01)),
+    (r"volt",                       lambda: Waveform(220, 5, 300, 0.5)),
+    (r"current|amp",                lambda: Waveform(10, 5, 300, 0.2)),
+    (r"power|kw|watt",              lambda: Waveform(2, 1.5, 300, 0.05)),
+]
+
+def default_waveform(name):
+    for pattern, waveform in profiles:
+        if re.search(pattern, name, re.IGNORECASE): return waveform()
+    return Waveform(1)
+
+class DeviceImage:
+    # Register image of one simulated slave. The fields of the register map are encoded as the node decodes them:
+    # value = raw * scale + bias, 'increment' registers per field (big-endian words), signed unless "signed" is False.
+    # Registers between two fields read as 0, the forbidden ranges of the library answer an illegal address exception
+    def __init__(self,library,unit,increment=None,shift=0,waveforms=None,span=None):
+        node = library.node
+        self.unit = unit
+        self.name = library.__name__
+        self.inc = increment if increment is not None else node.increment
+        self.forbidden = [[r[0]+shift, r[1]+shift] for r in node.forbidden]
+        self.registers = {0x03: {}, 0x04: {}}   # fc: {address: word}, the written and the constant registers
+        self.fields = {0x03: [], 0x04: []}      # fc: sorted [address, name, scale, bias, signed, waveform]
+        for name, value in node.memory_dict.items():
+            if value["fc"] not in (0x03, 0x04): continue
+            waveform = (waveforms or {}).get(name) or default_waveform(name)
+            self.fields[value["fc"]].append([value["address"]+shift, name, value["scale"], value["bias"], value.get("signed", True), waveform])
+        for fc in self.fields: self.fields[fc].sort(key=lambda f: f[0])
+        # The highest address that can be read (a bit beyond the map, as the node may read a whole block)
+        last = [f[0] for fc in self.fields for f in self.fields[fc]]
+        self.span = span if span is not None else (max(last) + self.inc + 64 if last else 0x10000)
+
+    def encode(self,value,scale,signed):
+        bits = 16 * self.inc
+        raw = int(round(value / scale)) if scale else 0
+        lo, hi = (-(1 << (bits-1)), (1 << (bits-1)) - 1) if signed else (0, (1 << bits) - 1)
+        raw = min(max(raw, lo), hi) & ((1 << bits) - 1)
+        return [(raw >> (16*(self.inc-1-k))) & 0xFFFF for k in range(self.inc)]
+
+    def read(self,fc,address,count):
+        # Register values of address..address+count-1, or an exception code
+        if fc not in self.registers: return ILLEGAL_FUNCTION
+        last = address + count - 1
+        if last >= self.span or any(f[0] <= last and f[1] >= address for f in self.forbidden): return ILLEGAL_ADDRESS
+        words = [self.registers[fc].get(a, 0) for a in range(address, address + count)]
+        # Only the fields of the block are evaluated
+        t = time.time()
+        for start, name, scale, bias, signed, waveform in self.fields[fc]:
+            if start > last: break
+            if start + self.inc <= address: continue
+            for k, word in enumerate(self.encode(waveform.value(t) - bias, scale, signed)):
+                if address <= start + k <= last: words[start + k - address] = word
+        return words
+
+    def write(self,address,values):
+        # Holding registers written by the client, a written field keeps the written value
+        if any(f[0] <= address + len(values) - 1 and f[1] >= address for f in self.forbidden): return ILLEGAL_ADDRESS
+        for k, word in enumerate(values): self.registers[0x03][address + k] = word
+        self.fields[0x03] = [f for f in self.fields[0x03] if not address <= f[0] < address + len(values)]
+        return None
+
+class Simulator:
+    # Serve the slaves of one bus, over a pseudo-terminal pair (Modbus RTU) or a TCP port (Modbus TCP, or RTU
+    # frames over TCP). Each response is delayed by the turnaround latency of the slave, plus the transmission time
+    # of the request and the response at the given baudrate (a pseudo-terminal has no wire time). Errors are
+    # injected per command with the given probabilities:
+    #   "timeout"   : no response
+    #   "exception" : a slave device failure exception response
+    #   "crc"       : a response with a wrong CRC (RTU framing only)
+    def __init__(self,devices,latency=[0.005,0.02],baudrate=9600,errors=None,seed=None):
+        self.devices = {d.unit: d for d in devices}
+        self.latency = latency      # [minimum, maximum] turnaround time of a slave (in seconds)
+        self.baudrate = baudrate    # None to answer without the transmission time
+        self.errors = dict(errors or {})
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()   # one command at a time, as on a half-duplex bus
+        self._stop = threading.Event()
+        self._threads = []
+        self._sockets = []
+        self.port = None            # pseudo-terminal path or TCP port the client connects to
+        self.stats = {"requests": 0, "responses": 0, "timeouts": 0, "exceptions": 0, "crc": 0,
+                      "bad_frames": 0, "bytes_in": 0, "bytes_out": 0}
+
+    def inject(self,kind):
+        p = self.errors.get(kind, 0)
+        return p > 0 and self._random.random() < p
+
+    def handle(self,unit,pdu):
+        # Response PDU of a request PDU, None for no response (unknown slave, broadcast or injected timeout).
+        # A broadcast (unit 0) write is applied to every slave, a broadcast read is ignored
+        device = self.devices.get(unit)
+        if device is None and unit != 0 or not pdu: return None
+        fc = pdu[0]
+        if device is None and fc not in (0x06, 0x10): return None
+        try:
+            if fc in (0x03, 0x04):
+                address, count = struct.unpack(">HH", pdu[1:5])
+                result = ILLEGAL_VALUE if not 1 <= count <= 125 else device.read(fc, address, count)
+                if not isinstance(result, int): response = struct.pack(">BB{}H".format(count), fc, 2*count, *result)
+            elif fc == 0x06:
+                address, value = struct.unpack(">HH", pdu[1:5])
+                targets = [device] if device else self.devices.values()
+                result = [d.write(address, [value]) for d in targets][-1]
+                response = pdu[:5]
+            elif fc == 0x10:
+                address, count, size = struct.unpack(">HHB", pdu[1:6])
+                values = list(struct.unpack(">{}H".format(count), pdu[6:6+2*count]))
+                targets = [device] if device else self.devices.values()
+                result = ILLEGAL_VALUE if size != 2*count else [d.write(address, values) for d in targets][-1]
+                response = pdu[:5]
+            else: result = ILLEGAL_FUNCTION
+        except (struct.error, IndexError): result = ILLEGAL_VALUE
+        if unit == 0: return None
+        if self.inject("timeout"):
+            self.stats["timeouts"] += 1; return None
+        if self.inject("exception"): result = DEVICE_FAILURE
+        if isinstance(result, int):
+            self.stats["exceptions"] += 1
+            return bytes([fc | 0x80, result])
+        return response
+
+    def respond(self,request,response):
+        # Wait as long as the command would take on the bus
+        delay = self._random.uniform(*self.latency)
+        if self.baudrate: delay += (len(request) + len(response)) * 11 / self.baudrate
+        time.sleep(delay)
+
+    def serve_rtu(self,read,write):
+        # RTU frames from a byte stream: the length of a request is known from its function code
+        buffer = b""
+        while not self._stop.is_set():
+            data = read()
+            if data is None: continue
+            if not data: return
+            buffer += data
+            self.stats["bytes_in"] += len(data)
+            while len(buffer) >= 8:
+                size = 9 + buffer[6] if buffer[1] in (0x0F, 0x10) else 8
+                if len(buffer) < size: break
+                frame, buffer = buffer[:size], buffer[size:]
+                if crc16(frame[:-2]) != struct.unpack("<H", frame[-2:])[0]:
+                    # Resynchronize on the next byte
+                    self.stats["bad_frames"] += 1
+                    buffer = frame[1:] + buffer
+                    continue
+                with self._lock:
+                    self.stats["requests"] += 1
+                    pdu = self.handle(frame[0], frame[1:-2])
+                    if pdu is None: continue
+                    response = bytes([frame[0]]) + pdu
+                    crc = crc16(response)
+                    if self.inject("crc"):
+                        crc ^= 0xFFFF; self.stats["crc"] += 1
+                    response += struct.pack("<H", crc)
+                    self.respond(frame, response)
+                    write(response)
+                    self.stats["responses"] += 1; self.stats["bytes_out"] += len(response)
+
+    def serve_tcp(self,read,write):
+        # Modbus TCP frames: MBAP header (transaction id, protocol id, length, unit) then the PDU
+        buffer = b""
+        while not self._stop.is_set():
+            data = read()
+            if data is None: continue
+            if not data: return
+            buffer += data
+            self.stats["bytes_in"] += len(data)
+            while len(buffer) >= 7:
+                tid, pid, length, unit = struct.unpack(">HHHB", buffer[:7])
+                if len(buffer) < 6 + length: break
+                frame, buffer = buffer[:6+length], buffer[6+length:]
+                with self._lock:
+                    self.stats["requests"] += 1
+                    pdu = self.handle(unit, frame[7:])
+                    if pdu is None: continue
+                    response = struct.pack(">HHHB", tid, pid, len(pdu) + 1, unit) + pdu
+                    self.respond(frame, response)
+                    write(response)
+                    self.stats["responses"] += 1; self.stats["bytes_out"] += len(response)
+
+    def start_thread(self,target,*args):
+        thread = threading.Thread(target=target, args=args, name="modbus simulator", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def start_pty(self):
+        # Serve Modbus RTU on a new pseudo-terminal pair, return the path the client opens as its serial port
+        master, slave = os.openpty()
+        tty.setraw(master); tty.setraw(slave)
+        # The slave end is kept open, so the pair stays up when the client closes and reopens the port
+        self._sockets.extend([master, slave])
+        self.port = os.ttyname(slave)
+        def read():
+            if not select.select([master], [], [], 0.1)[0]: return None
+            try: return os.read(master, 4096)
+            except OSError: return None
+        self.start_thread(self.serve_rtu, read, lambda data: os.write(master, data))
+        return self.port
+
+    def start_tcp(self,host="127.0.0.1",port=5020,framer="tcp"):
+        # Serve Modbus TCP (framer "tcp") or RTU frames over TCP (framer "rtu") on host:port, port 0 for any free port
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((host, port)); server.listen(4)
+        server.settimeout(0.1)
+        self._sockets.append(server)
+        self.port = server.getsockname()[1]
+        serve = self.serve_rtu if framer == "rtu" else self.serve_tcp
+        def accept():
+            while not self._stop.is_set():
+                try: conn, _ = server.accept()
+                except (socket.timeout, OSError): continue
+                conn.settimeout(0.1)
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                def read(conn=conn):
+                    try: return conn.recv(4096)
+                    except socket.timeout: return None
+                    except OSError: return b""
+                self.start_thread(serve, read, conn.sendall)
+        self.start_thread(accept)
+        return self.port
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads: thread.join(1)
+        for s in self._sockets:
+            try: s.close() if isinstance(s, socket.socket) else os.close(s)
+            except OSError: pass
+        self._sockets = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.stop()
+
+def parse_device(text):
+    # "<library>:<unit>[:increment=<n>][:shift=<n>]", e.g. "msystem_M5XWTU113:1:increment=2:shift=2"
+    name, unit, *options = text.split(":")
+    kwargs = {}
+    for option in options:
+        key, value = option.split("=")
+        kwargs[key] = int(value, 0)
+    return DeviceImage(load_device(name), int(unit), **kwargs)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Modbus RTU/TCP slave simulator of the device libraries")
+    parser.add_argument("--device", action="append", required=True, help="<library>:<unit>[:increment=<n>][:shift=<n>], once per slave")
+    parser.add_argument("--pty", action="store_true", help="serve Modbus RTU on a pseudo-terminal (default)")
+    parser.add_argument("--tcp", type=int, default=None, help="serve on this TCP port instead")
+    parser.add_argument("--framer", default="tcp", choices=["tcp", "rtu"], help="frames over TCP")
+    parser.add_argument("--baudrate", type=int, default=9600, help="emulated serial speed, 0 for none")
+    parser.add_argument("--latency", type=float, nargs=2, default=[0.005, 0.02], help="turnaround time of a slave [min max] (in seconds)")
+    parser.add_argument("--timeout", type=float, default=0, help="probability of no response")
+    parser.add_argument("--exception", type=float, default=0, help="probability of an exception response")
+    parser.add_argument("--crc", type=float, default=0, help="probability of a response with a wrong CRC")
+    args = parser.parse_args()
+
+    simulator = Simulator([parse_device(d) for d in args.device], args.latency, args.baudrate or None,
+                          {"timeout": args.timeout, "exception": args.exception, "crc": args.crc})
+    if args.tcp is not None: print("<===== Modbus simulator on TCP port {} =====>".format(simulator.start_tcp(port=args.tcp, framer=args.framer)))
+    else: print("<===== Modbus simulator on {} =====>".format(simulator.start_pty()))
+    for unit, device in sorted(simulator.devices.items()):
+        print(" -- unit {}: {} (increment {}) --".format(unit, device.name, device.inc))
+    try:
+        while True: time.sleep(1)
+    except KeyboardInterrupt: pass
+    finally:
+        simulator.stop()
+        print(simulator.stats)
@@ -0,0 +1,134 @@
+"""
+#title           :exporter.py
+#description     :Prometheus/OpenMetrics exporter of the latest readings of every node and of the bus health
+#author          :Nicholas Putra Rihandoko
+#date            :2026/10/18
+#version         :0.1
+#usage           :Energy Monitoring System, scrape http://<raspberry pi>:<port>/metrics
+#notes           :the page is rendered once per polling cycle by update(), a scrape only sends the cached bytes
+#python_version  :3.7.3
+#==============================================================================
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import bisect
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+def label(value):
+    # Escape a label value (backslash, double quote and new line)
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404); return
+        body = self.server.exporter.body
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self,format,*args):
+        # No line on the console per scrape
+        pass
+
+class Histogram:
+    # Cumulative histogram with fixed bucket bounds (in seconds), as exposed by OpenMetrics
+    def __init__(self,buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0]*(len(self.buckets)+1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self,value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self,name,labels=""):
+        sep = "," if labels else ""
+        lines, total = [], 0
+        for bound, n in zip(self.buckets, self.counts):
+            total += n
+            lines.append('{}_bucket{{{}{}le="{}"}} {}'.format(name, labels, sep, float(bound), total))
+        lines.append('{}_bucket{{{}{}le="+Inf"}} {}'.format(name, labels, sep, self.count))
+        lines.append("{}_sum{} {}".format(name, "{" + labels + "}" if labels else "", self.sum))
+        lines.append("{}_count{} {}".format(name, "{" + labels + "}" if labels else "", self.count))
+        return lines
+
+class MetricsExporter:
+    # Families of the page:
+    #   modbus_field                    gauge, latest valid reading of each node field (with its reading time)
+    #   modbus_node_up                  gauge, 0 if the node failed in the last polling cycle
+    #   modbus_commands/_errors         counters of each node (frames/s and error rate are their rate())
+    #   modbus_pacing_margin_seconds    gauge, learned turnaround margin of each node
+    #   modbus_cycle_duration_seconds   histogram of the polling cycles, modbus_bus_duration_seconds gauge per bus
+    #   modbus_missed_deadlines         counter of the scheduler, per node
+    #   modbus_command_latency_seconds  histogram per node and function code (with a transaction HistogramSink)
+    #   gauges/counters given to update(), e.g. the outbox depth
+    cycle_buckets = (0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 30)
+
+    def __init__(self,port=9105,host="0.0.0.0",prefix="modbus"):
+        self.prefix = prefix
+        self.body = b"# EOF\n"     # the cached page
+        self.cycle = Histogram(self.cycle_buckets)
+        self._series = {}           # (node, field): 'modbus_field{node="..",field=".."} ', built once
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._server.exporter = self
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics exporter", daemon=True)
+        self._thread.start()
+
+    def series(self,node,field):
+        key = (node, field)
+        name = self._series.get(key)
+        if name is None:
+            name = self._series[key] = '{}_field{{node="{}",field="{}"}} '.format(self.prefix, label(node), label(field))
+        return name
+
+    def update(self,server,snapshots,bus,sched=None,histogram=None,gauges=None,counters=None):
+        # Render the page of one polling cycle: server and snapshots as for tsdb.append_nodes, bus the BusPoller,
+        # sched the PollScheduler, histogram the transaction HistogramSink, gauges/counters {name: value}
+        p = self.prefix
+        self.cycle.observe(bus.cycle_time)
+        lines = ["# TYPE {}_field gauge".format(p), "# HELP {}_field Latest valid reading of each node field.".format(p)]
+        for node, snapshot in zip(server, snapshots):
+            for name, value, timestamp in snapshot.fields():
+                lines.append("{}{} {:.3f}".format(self.series(node._name, name), value, timestamp))
+        lines.append("# TYPE {}_node_up gauge".format(p))
+        lines.extend('{}_node_up{{node="{}"}} {}'.format(p, label(node._name), 0 if node._name in bus.error else 1) for node in server)
+        pacing = [(label(name), metric) for name, metric in bus.pacing.items()]
+        lines.append("# TYPE {}_commands counter".format(p))
+        lines.extend('{}_commands_total{{node="{}"}} {}'.format(p, name, m["commands"]) for name, m in pacing)
+        lines.append("# TYPE {}_command_errors counter".format(p))
+        lines.extend('{}_command_errors_total{{node="{}"}} {}'.format(p, name, m["errors"]) for name, m in pacing)
+        lines.append("# TYPE {}_pacing_margin_seconds gauge".format(p))
+        lines.extend('{}_pacing_margin_seconds{{node="{}"}} {}'.format(p, name, m["margin"]) for name, m in pacing)
+        lines.append("# TYPE {}_cycle_duration_seconds histogram".format(p))
+        lines.extend(self.cycle.lines("{}_cycle_duration_seconds".format(p)))
+        lines.append("# TYPE {}_bus_duration_seconds gauge".format(p))
+        lines.extend('{}_bus_duration_seconds{{bus="{}"}} {}'.format(p, label(name), t) for name, t in bus.bus_time.items())
+        if sched is not None:
+            missed = {}
+            for (name, item), n in sched.missed_count.items(): missed[name] = missed.get(name, 0) + n
+            lines.append("# TYPE {}_missed_deadlines counter".format(p))
+            lines.extend('{}_missed_deadlines_total{{node="{}"}} {}'.format(p, label(node._name), missed.get(node._name, 0)) for node in server)
+        if histogram is not None:
+            lines.append("# TYPE {}_command_latency_seconds histogram".format(p))
+            for (name, fc), stat in sorted(histogram.summary().items()):
+                h = Histogram(histogram.buckets)
+                h.counts, h.sum, h.count = stat["histogram"], stat["latency_sum"], stat["count"]
+                lines.extend(h.lines("{}_command_latency_seconds".format(p), 'node="{}",fc="{}"'.format(label(name), fc)))
+        for name, value in sorted((gauges or {}).items()):
+            if value is not None: lines.extend(["# TYPE {} gauge".format(name), "{} {}".format(name, value)])
+        for name, value in sorted((counters or {}).items()):
+            if value is not None: lines.extend(["# TYPE {} counter".format(name), "{}_total {}".format(name, value)])
+        lines.append("# EOF\n")
+        self.body = "\n".join(lines).encode()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,136 @@
+"""
+#title           :instrument.py
+#description     :sinks of the per-command Modbus transaction records (histogram in memory, JSON lines file, statsd UDP)
+#author          :Nicholas Putra Rihandoko
+#date            :2026/10/18
+#version         :0.1
+#usage           :Energy Monitoring System
+#notes           :set Node.probe = instrument.setup([...]) to record every command of every node
+#python_version  :3.7.3
+#==============================================================================
+"""
+
+import os
+import json
+import time
+import socket
+import bisect
+import threading
+
+class Instrument:
+    # The probe of the nodes: hands each Transaction record to every sink
+    def __init__(self,sinks):
+        self.sinks = list(sinks)
+
+    def __call__(self,record):
+        for sink in self.sinks: sink.add(record)
+
+    def get(self,kind):
+        # The first sink of a class, e.g. instrument.get(HistogramSink)
+        for sink in self.sinks:
+            if isinstance(sink, kind): return sink
+        return None
+
+    def close(self):
+        for sink in self.sinks: sink.close()
+
+class HistogramSink:
+    # Aggregates of the commands of each (node, function code): count, errors by type, bytes, sleep time and a
+    # histogram of the round-trip latency with fixed bucket bounds (in seconds)
+    buckets = (0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5)
+
+    def __init__(self):
+        self._lock = threading.Lock()   # the nodes of several buses are read by several threads
+        self.stats = {}
+
+    def add(self,record):
+        key = (record.node, record.fc)
+        with self._lock:
+            stat = self.stats.get(key)
+            if stat is None:
+                stat = self.stats[key] = {"count": 0, "errors": {}, "retries": 0, "request_bytes": 0, "response_bytes": 0,
+                                          "sleep": 0, "latency_sum": 0, "latency_max": 0, "histogram": [0]*(len(self.buckets)+1)}
+            stat["count"] += 1
+            if record.error is not None: stat["errors"][record.error] = stat["errors"].get(record.error, 0) + 1
+            if record.retries: stat["retries"] += 1
+            stat["request_bytes"] += record.request
+            stat["response_bytes"] += record.response
+            stat["sleep"] += record.sleep
+            stat["latency_sum"] += record.latency
+            if record.latency > stat["latency_max"]: stat["latency_max"] = record.latency
+            stat["histogram"][bisect.bisect_left(self.buckets, record.latency)] += 1
+
+    def percentile(self,stat,q):
+        # Upper bound of the bucket holding the q-th fraction of the commands (None above the last bound)
+        rank, total = q * stat["count"], 0
+        for i, n in enumerate(stat["histogram"]):
+            total += n
+            if total >= rank: return self.buckets[i] if i < len(self.buckets) else None
+        return None
+
+    def summary(self):
+        with self._lock:
+            return {key: dict(stat, errors=dict(stat["errors"]), histogram=list(stat["histogram"])) for key, stat in self.stats.items()}
+
+    def print_summary(self):
+        for (node, fc), stat in sorted(self.summary().items()):
+            p50, p95 = self.percentile(stat, 0.5), self.percentile(stat, 0.95)
+            print(" -- {} fc {}: {} commands, {} errors, {:.1f} ms mean, p50 <= {}, p95 <= {}, {:.1f} ms sleep per command --".format(
+                node, fc, stat["count"], sum(stat["errors"].values()), 1000*stat["latency_sum"]/stat["count"],
+                "{:.0f} ms".format(1000*p50) if p50 else "-", "{:.0f} ms".format(1000*p95) if p95 else "-", 1000*stat["sleep"]/stat["count"]))
+
+    def close(self):
+        pass
+
+class JsonLinesSink:
+    # One JSON object per command appended to a file, written to the disk every 'sync' seconds
+    def __init__(self,path,sync=60):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "a")
+        self._lock = threading.Lock()
+        self.sync = sync
+        self._synced = time.monotonic()
+
+    def add(self,record):
+        line = json.dumps(record.as_dict()) + "\n"
+        with self._lock:
+            self._file.write(line)
+            if time.monotonic() - self._synced >= self.sync:
+                self._file.flush(); self._synced = time.monotonic()
+
+    def close(self):
+        with self._lock: self._file.close()
+
+class StatsdSink:
+    # statsd metrics over UDP (fire and forget, a missing statsd daemon costs nothing), one datagram per command:
+    # <prefix>.<node>.fc<fc>.latency (ms), .sleep (ms), .bytes_in/.bytes_out (counters) and .error.<type> (counter)
+    def __init__(self,host="127.0.0.1",port=8125,prefix="modbus"):
+        self._address = (host, port)
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+        self.prefix = prefix
+        self._names = {}    # (node, fc): metric name prefix
+
+    def add(self,record):
+        key = (record.node, record.fc)
+        name = self._names.get(key)
+        if name is None:
+            name = self._names[key] = "{}.{}.fc{}".format(self.prefix, "".join(c if c.isalnum() else "_" for c in record.node), record.fc)
+        lines = ["{}.latency:{:.2f}|ms".format(name, 1000*record.latency), "{}.sleep:{:.2f}|ms".format(name, 1000*record.sleep),
+                 "{}.bytes_out:{}|c".format(name, record.request), "{}.bytes_in:{}|c".format(name, record.response)]
+        if record.error is not None: lines.append("{}.error.{}:1|c".format(name, record.error))
+        try: self._socket.sendto("\n".join(lines).encode(), self._address)
+        except OSError: pass
+
+    def close(self):
+        self._socket.close()
+
+def setup(sinks,directory=".",statsd=("127.0.0.1",8125)):
+    # Instrument of the named sinks: "histogram", "jsonl" (<directory>/transactions.jsonl) and/or "statsd"
+    made = []
+    for sink in sinks:
+        if sink == "histogram": made.append(HistogramSink())
+        elif sink == "jsonl": made.append(JsonLinesSink(os.path.join(directory, "transactions.jsonl")))
+        elif sink == "statsd": made.append(StatsdSink(*statsd))
+        else: raise ValueError("unknown transaction sink '{}'".format(sink))
+    return Instrument(made)
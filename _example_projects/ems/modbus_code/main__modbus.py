@@ -12,9 +12,19 @@
 
 # Import library
 import query
+import poller
+import pipeline
+import tsdb
+import rollup
+import instrument
+import exporter
+import console
 from pymodbus.client.sync import ModbusSerialClient as ModbusClient
 import datetime # RTC Real Time Clock
 import time
+import os
+import atexit
+from lib.modbus_node import Node
 from lib import omron_KMN1FLK as omron
 from lib import msystem_M5XWTU113 as msystem
 from lib import electricPowerCalc as calc
@@ -26,9 +36,13 @@ bytesize        = 8
 stopbits        = 1
 parity          = 'E'
 baudrate        = 9600   # data/byte transmission speed (in bytes per second)
-client_latency  = 300   # the delay time master/client takes from receiving response to sending a new command/request (in milliseconds)
+client_latency  = 300   # the starting delay time master/client takes from receiving response to sending a new command/request (in milliseconds), then learned per node
 timeout         = 1   # the maximum time the master/client will wait for response from slave/server (in seconds)
 interval        = 1   # the period between each subsequent communication routine/loop (in seconds)
+transaction_sinks = ["histogram"] # per-command records of the Modbus transactions: "histogram", "jsonl" and/or "statsd" ([] to turn off)
+metrics_port    = 0 # port of the Prometheus/OpenMetrics exporter, http://<raspberry pi>:<port>/metrics (0 to turn off)
+console_mode    = "summary" # the console output of each polling cycle: "off", "summary" (a line per node), "changes" (changed fields only) or "full"
+console_period  = 60 # the period of the full dump of every field in "full" mode (in seconds, 0 for every cycle)
 
 # Define MySQL Database parameters
 mysql_server    = {"host":"10.4.171.204",
@@ -37,8 +51,18 @@ mysql_server    = {"host":"10.4.171.204",
                     "db":"test",
                     "table":"test",
                     "port":3306}
-mysql_timeout   = 3 # the maximum time this device will wait for completing MySQl query (in seconds)
+mysql_timeout   = 3 # the maximum time this device will wait for each MySQl connection/query step (in seconds, a fraction is allowed)
 mysql_interval  = 300 # the period between each subsequent update to database (in seconds)
+upload_queue    = 100 # the maximum number of records waiting for the upload worker
+upload_policy   = "spill" # when the queue is full: "block", "drop_oldest", "drop_newest" or "spill" (store it locally at once)
+upload_idle     = 30 # the period between each retry of the upload when there is no new record (in seconds)
+mysql_retention = 0 # the number of days the data is kept in the database, older data is deleted once a day (0 to keep everything)
+mysql_datetime  = "shutdown_date" # the date/datetime column used by the retention
+history_keep    = 12 # the number of months of readings kept in the local time-series store (0 to keep everything)
+history_age     = 900 # the maximum time (in seconds) a reading stays in memory before it is written to the local time-series store
+rollup_windows  = [60, 900] # the length of the rollup windows of min/max/mean/last/count per field (in seconds), each a multiple of the previous one
+rollup_upload   = [900] # the rollup windows that are logged and uploaded
+mysql_rollup    = "" # the table of the rollup rows, e.g. "test_rollup", it must be created first with python3 rollup.py test_rollup ("" to neither log nor upload them)
 
 #query.debugging()  # Monitor Modbus communication for debugging
 init = True  # variable to check Modbus initialization
@@ -50,28 +74,26 @@ def setup_modbus():
     # Connect to the Modbus serial
     client.connect()
     # Define the Modbus slave/server (nodes) objects
-    ct1 = omron.node(unit=3, name='OMRON CT1', client=client, delay=client_latency, max_count=20, increment=2, shift=0)
-    ct2 = omron.node(unit=2, name='OMRON CT2', client=client, delay=client_latency, max_count=20, increment=2, shift=0)
-    ct3 = omron.node(unit=1, name='MSYSTEM', client=client, delay=client_latency, max_count=20, increment=2, shift=2)
+    ct1 = omron.node(unit=3, name='OMRON CT1', client=client, delay=client_latency, max_count=20, increment=2, shift=0, baudrate=baudrate)
+    ct2 = omron.node(unit=2, name='OMRON CT2', client=client, delay=client_latency, max_count=20, increment=2, shift=0, baudrate=baudrate)
+    ct3 = omron.node(unit=1, name='MSYSTEM', client=client, delay=client_latency, max_count=20, increment=2, shift=2, baudrate=baudrate)
     server = [ct1,ct2,ct3]
     return server
 
-def read_modbus(server):
-    #return
+def setup_schedule(bus):
+    global interval
     addr=[["Voltage_1",0x0208],
             [0x0000],
             ["voltage"]]
-    for i in range(len(server)):
-        try:
-            pass
-            server[i].send_command(command="read",address=addr[i])
-            #print(server[i].map_read_attr([0x0000,0x000E,0x0208]))
-        except Exception as e:
-            # Print the error message
-            print("problem with",server[i]._name,":")
-            print(e)
-            print("<===== ===== continuing ===== =====>")
-            print("")
+    # Sampling period and jitter tolerance (in seconds) of the read address that change slower than the others,
+    # the rest is read every interval
+    rate=[{0x0208:[60,5]},{},{}]
+    return poller.PollScheduler(bus, addr, rate, default=[interval, interval/2], tick=interval)
+
+def read_modbus(sched):
+    #return
+    # Read the due address of every node, the nodes of different serial ports are read at the same time
+    return sched.read()
             
 def write_modbus(server):
     #return
@@ -104,16 +126,79 @@ def update_database(server, timer):
                 timer.strftime("%Y-%m-%d"), timer.strftime("%H:%M:%S"), downtime, total_downtime]
     filename = 'modbus_log.csv'
 
-    query.log_in_csv(title ,data, timer, filename)
-    query.retry_mysql(mysql_server, mysql_query, filename, mysql_timeout)
+    # Hand the record over to the upload worker, the Modbus polling goes on while it is stored and uploaded
+    worker.put((timer, filename, title, mysql_query, (tuple(data),)))
+
+def update_rollup(rows, timer):
+    # Hand the closed windows of the rollup_upload lengths over to the upload worker, all in one record
+    rows = tuple(rollup.to_row(*r) for r in rows if r[0] in rollup_upload)
+    if not rows or not mysql_rollup: return
+    mysql_query = ("INSERT INTO `{}` ({}) VALUES ({})".format(mysql_rollup,
+                                                                ",".join(rollup.title),
+                                                                ",".join(['%s' for _ in range(len(rollup.title))])))
+    worker.put((timer, 'rollup_log.csv', rollup.title, mysql_query, rows))
+
+def store_record(record):
+    # Run by the upload worker (or by the poll loop when the queue is full and upload_policy is "spill")
+    timer, filename, title, mysql_query, rows = record
+    for data in rows: query.log_in_csv(title, data, timer, filename)
+    query.queue_mysql_many(mysql_query, rows)
+
+def report_transactions():
+    # Print the latency and errors of the Modbus commands of each node since start-up
+    histogram = Node.probe.get(instrument.HistogramSink) if Node.probe is not None else None
+    if histogram is not None:
+        histogram.print_summary()
+        print("")
+
+def export_metrics(snapshots):
+    # Render the metrics page once per polling cycle, the scrapes only get the rendered page
+    if metrics is None: return
+    histogram = Node.probe.get(instrument.HistogramSink) if Node.probe is not None else None
+    uploader = query.mysql_uploader
+    metrics.update(server, snapshots, bus, sched, histogram,
+                   gauges={"outbox_pending_rows": query.get_outbox().pending(), "upload_queue_records": worker.pending()},
+                   counters={"upload_rows": uploader.sent if uploader is not None else None,
+                             "upload_dropped_records": worker.dropped, "upload_spilled_records": worker.spilled})
+
+def upload_records():
+    # Run by the upload worker after each record, and every upload_idle seconds
+    query.retry_mysql(mysql_server, mysql_timeout)
+    # Write the full chunks of the local time-series store
+    history.flush()
+    history.expire(datetime.datetime.now())
+    query.retain_db(mysql_server, mysql_retention, mysql_datetime, timeout=mysql_timeout)
 
 #################################################################################################################
 
+# Keep every reading in the local time-series store (save/tsdb)
+history = tsdb.TimeSeriesStore(os.path.join(query.log_directory, 'tsdb'), keep=history_keep, age=history_age)
+atexit.register(history.close)
+
+# Record every Modbus command of every node
+if transaction_sinks:
+    Node.probe = instrument.setup(transaction_sinks, query.log_directory)
+    atexit.register(Node.probe.close)
+
+# Serve the latest readings and the bus health to Prometheus
+metrics = exporter.MetricsExporter(metrics_port) if metrics_port else None
+
+# Console output of each polling cycle
+display = console.Console(console_mode, console_period)
+
+# Downsample every reading into min/max/mean/last/count per field and window
+rollups = rollup.Rollup(rollup_windows)
+
+# Store and upload the records in the background
+worker = pipeline.UploadWorker(store_record, upload_records, size=upload_queue, policy=upload_policy, idle=upload_idle)
+
 # Checking the connection Modbus
 while init:
     try:
         # Setup Raspberry Pi as Modbus client/master
         server = setup_modbus()
+        bus = poller.BusPoller(server)
+        sched = setup_schedule(bus)
         print("<===== Connected to Modbus Communication =====>")
         print("")
         init = False
@@ -137,8 +222,12 @@ while not init:
             
         # Send the command to read the measured value and do all other things
         timer = datetime.datetime.now()
-        read_modbus(server)
-        query.print_response(server, timer)
+        snapshots = read_modbus(sched)
+        history.append_nodes(server, snapshots)
+        rollups.append_nodes(server, snapshots)
+        update_rollup(rollups.close(time.time()), timer)
+        export_metrics(snapshots)
+        display.show(server, snapshots, timer, bus.error, query.get_cpu_temperature)
         
         # Check elapsed time
         if (timer - start).total_seconds() > mysql_interval or first[1] == True:
@@ -146,8 +235,9 @@ while not init:
             first[1] = False
             # Update/push data to database
             update_database(server, timer)
+            report_transactions()
         
-        time.sleep(interval)
+        time.sleep(sched.wait_time())
     
     except Exception as e:
         # Print the error message
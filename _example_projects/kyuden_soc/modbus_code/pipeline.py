@@ -0,0 +1,91 @@
+"""
+#title           :pipeline.py
+#description     :store and upload the records of the poll loop in a background worker thread
+#author          :Nicholas Putra Rihandoko
+#date            :2026/10/18
+#version         :0.1
+#usage           :Energy Monitoring System
+#notes           :the poll loop only puts immutable records into a bounded queue, it never waits for the database
+#python_version  :3.7.3
+#==============================================================================
+"""
+
+import collections
+import threading
+
+class UploadWorker:
+    # A record goes through store(record) (local CSV log and outbox, fast) then upload() (MySQL, may be slow or
+    # unreachable), both run by the worker thread. When the queue is full, a new record is handled by the policy:
+    #   "block"       : wait up to block_timeout for a free place, then drop the new record
+    #   "drop_oldest" : drop the oldest waiting record to make place for the new one
+    #   "drop_newest" : drop the new record
+    #   "spill"       : store the new record at once on the caller's thread, it is uploaded later from the outbox
+    policies = ("block", "drop_oldest", "drop_newest", "spill")
+
+    def __init__(self,store,upload,size=100,policy="spill",block_timeout=1,idle=30):
+        if policy not in self.policies: raise ValueError("unknown policy '{}'".format(policy))
+        self._store = store
+        self._upload = upload
+        self._size = size                   # the maximum number of waiting records
+        self.policy = policy
+        self.block_timeout = block_timeout  # in seconds
+        self.idle = idle                    # the period of the upload retries when no record comes in (in seconds)
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._lock = threading.Lock()       # store() is never run by two threads at the same time
+        self._stop = False
+        self.done = 0       # records stored by the worker
+        self.dropped = 0    # records dropped because the queue was full
+        self.spilled = 0    # records stored on the caller's thread because the queue was full
+        self._thread = threading.Thread(target=self.run, name="upload worker", daemon=True)
+        self._thread.start()
+
+    def put(self,record):
+        # Hand a record over to the worker, return False if it is dropped
+        with self._cond:
+            if len(self._queue) >= self._size and self.policy == "block":
+                self._cond.wait_for(lambda: len(self._queue) < self._size, self.block_timeout)
+            if len(self._queue) < self._size or self.policy == "drop_oldest":
+                if len(self._queue) >= self._size:
+                    self._queue.popleft(); self.dropped += 1
+                self._queue.append(record)
+                self._cond.notify_all()
+                return True
+            if self.policy != "spill":
+                self.dropped += 1
+                return False
+        self.store(record)
+        self.spilled += 1
+        return True
+
+    def pending(self):
+        return len(self._queue)
+
+    def store(self,record):
+        with self._lock: self._store(record)
+
+    def run(self):
+        while True:
+            with self._cond:
+                if not self._queue and not self._stop: self._cond.wait(self.idle)
+                if not self._queue and self._stop: return
+                record = self._queue.popleft() if self._queue else None
+                self._cond.notify_all()
+            try:
+                if record is not None:
+                    self.store(record)
+                    self.done += 1
+                self._upload()
+            except Exception as e:
+                # Print the error message
+                print("problem with upload worker:")
+                print(e)
+                print("<===== ===== continuing ===== =====>")
+                print("")
+
+    def stop(self,timeout=None):
+        # Let the worker store the waiting records, then end the thread
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
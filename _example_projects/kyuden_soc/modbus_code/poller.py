@@ -0,0 +1,144 @@
+"""
+#title           :poller.py
+#description     :poll Modbus nodes of several serial ports (buses) in parallel, on a per-field schedule
+#author          :Nicholas Putra Rihandoko
+#date            :2026/10/18
+#version         :0.2
+#usage           :Energy Monitoring System
+#notes           :one worker thread per Modbus client, nodes of the same client are read in order
+#python_version  :3.7.3
+#==============================================================================
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+class BusPoller:
+    def __init__(self,server):
+        self._server = server
+        # Group the nodes by their Modbus client (physical bus), keeping the order of server
+        self._bus = {}
+        for i, node in enumerate(server):
+            self._bus.setdefault(id(node._client), []).append(i)
+        self._executor = ThreadPoolExecutor(max_workers=len(self._bus)) if len(self._bus) > 1 else None
+        self.cycle_time = 0     # duration of the last polling cycle (in seconds)
+        self.bus_time = {}      # duration of the last polling cycle of each bus, by the name of its first node
+        self.error = {}         # last exception of each node that failed in the last polling cycle, by node name
+        self.pacing = {}        # pacing metric of each node (see Node.get_pacing), by node name
+
+    def read_bus(self,index,addr):
+        # Read the nodes of one bus one after another, a failing node does not stop the others
+        start = time.monotonic()
+        for i in index:
+            # Nothing to read from this node in this polling cycle
+            if not addr[i]: continue
+            try:
+                self._server[i].send_command(command="read",address=addr[i])
+            except Exception as e:
+                self.error[self._server[i]._name] = e
+                # Print the error message
+                print("problem with",self._server[i]._name,":")
+                print(e)
+                print("<===== ===== continuing ===== =====>")
+                print("")
+        self.bus_time[self._server[index[0]]._name] = time.monotonic() - start
+
+    def read(self,addr):
+        # Send the read command to every node (addr[i] for server[i]), all buses at the same time, then return
+        # one consistent snapshot of every node's readings taken once all buses are done (cycle time = slowest bus)
+        start = time.monotonic()
+        self.error = {}
+        if self._executor is None:
+            for index in self._bus.values(): self.read_bus(index, addr)
+        else:
+            jobs = [self._executor.submit(self.read_bus, index, addr) for index in self._bus.values()]
+            for job in jobs: job.result()
+        self.cycle_time = time.monotonic() - start
+        self.pacing = {node._name: node.get_pacing() for node in self._server}
+        return [node.snapshot() for node in self._server]
+
+    def close(self):
+        if self._executor is not None: self._executor.shutdown()
+
+class PollScheduler:
+    # Deadline-aware polling: each read item (field, raw address, calculated or "compile" parameter) of a node has
+    # its own sampling period and jitter tolerance, so slow-changing data is not read as often as fast data.
+    # An item is due once its deadline minus its jitter has passed; it is late (a missed deadline) when it is read
+    # after its deadline plus its jitter. Each cycle only the due items are read, along with the items of the same
+    # node that are already inside their read blocks (free) or that only extend a block (cheap neighbours)
+    pack = 0.5  # fraction of its period after which an item that is not due yet may be read along as a neighbour
+
+    def __init__(self,bus,addr,rate=None,default=None,tick=0):
+        # addr: the read items of each node (as for BusPoller.read)
+        # rate: {item: [period, jitter]} of each node, for the items that do not follow default [period, jitter]
+        # tick: the shortest time between the start of two polling cycles (in seconds)
+        self._bus = bus
+        self._tick = tick
+        self._last = None
+        self._item = []
+        now = time.monotonic()
+        for i, node in enumerate(bus._server):
+            items = []
+            for a in addr[i]:
+                period, jitter = (rate[i] if rate else {}).get(a, default)
+                fc, footprint = node.get_footprint(a)
+                # Every item is due at start-up
+                items.append({"address": a, "period": period, "jitter": jitter, "fc": fc,
+                              "footprint": footprint, "deadline": now})
+            self._item.append(items)
+        self.missed = []    # (node name, item, lateness in seconds) of the deadlines missed in the last polling cycle
+        self.missed_count = {}  # number of missed deadlines, by (node name, item)
+
+    def plan_node(self,i,now):
+        # Pick the due items of node i and pack their not-due neighbours into the same read blocks
+        node = self._bus._server[i]
+        due = [item for item in self._item[i] if now >= item["deadline"] - item["jitter"] and item["fc"] is not None]
+        if not due: return []
+        # A read request has a single function code, items of another function code wait for the next cycle
+        fc = due[0]["fc"]
+        due = [item for item in due if item["fc"] == fc]
+        blocks = node.plan_blocks(sorted(set(a for item in due for a in item["footprint"])))
+        picked, taken = list(due), set(id(item) for item in due)
+        for item in self._item[i]:
+            if id(item) in taken or item["fc"] != fc or not item["footprint"]: continue
+            first, last = item["footprint"][0], item["footprint"][-1]
+            if all(any(b[0] <= a <= b[1] for b in blocks) for a in item["footprint"]):
+                picked.append(item)
+            elif now - (item["deadline"] - item["period"]) >= self.pack*item["period"]:
+                for b in blocks:
+                    lo, hi = min(b[0], first), max(b[1], last)
+                    if node.can_read_block(lo, hi):
+                        b[0], b[1] = lo, hi; picked.append(item); break
+        # Same order as declared, so the same set of items is always the same read request (one cached read plan)
+        taken = set(id(item) for item in picked)
+        return [item for item in self._item[i] if id(item) in taken]
+
+    def wait_time(self):
+        # Time (in seconds) until the next polling cycle, when the first item becomes due
+        now = time.monotonic()
+        due = min([item["deadline"] - item["jitter"] for items in self._item for item in items] or [now])
+        if self._last is not None: due = max(due, self._last + self._tick)
+        return max(0, due - now)
+
+    def read(self):
+        # Read the due items of every node through the BusPoller and move their deadlines
+        now = self._last = time.monotonic()
+        picked = [self.plan_node(i, now) for i in range(len(self._item))]
+        response = self._bus.read([[item["address"] for item in items] for items in picked])
+        self.missed = []
+        for i, items in enumerate(picked):
+            name = self._bus._server[i]._name
+            # The items of a failing node stay due
+            if name in self._bus.error: continue
+            for item in items:
+                late = now - item["deadline"]
+                if late > item["jitter"]:
+                    self.missed.append((name, item["address"], late))
+                    key = (name, item["address"])
+                    self.missed_count[key] = self.missed_count.get(key, 0) + 1
+                # Keep the phase of the items read on time, restart the period of the others
+                if late >= -item["jitter"] and item["deadline"] + item["period"] > now: item["deadline"] += item["period"]
+                else: item["deadline"] = now + item["period"]
+        if self.missed:
+            print(" -- missed deadline of {} read address, up to {:.1f} s late --".format(len(self.missed), max(m[2] for m in self.missed)))
+        return response
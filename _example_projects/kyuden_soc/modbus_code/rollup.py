@@ -0,0 +1,133 @@
+"""
+#title           :rollup.py
+#description     :downsample the readings into min/max/mean/last/count rows per field and window (e.g. 1 min -> 15 min)
+#author          :Nicholas Putra Rihandoko
+#date            :2026/10/18
+#version         :0.1
+#usage           :Energy Monitoring System
+#notes           :each sample is added to its window in O(1), each closed window is merged into the next (longer) one
+#python_version  :3.7.3
+#==============================================================================
+"""
+
+import datetime
+
+# The rows of a window go to a table of their own, which must exist before mysql_rollup is set in main__modbus.py:
+# the outbox keeps the rows that the server can not insert (e.g. 1146 table doesn't exist) and uploads in order,
+# so a missing table holds back every later upload. Create it once with the statement of create_table(), e.g.
+#   python3 rollup.py kyuden_soc_rollup | mysql -u <user> -p <database>
+title = ["node","field","window_length","window_start","samples","min_value","max_value","mean_value","last_value"]
+
+def create_table(table):
+    # MySQL statement that creates the table of the rollup rows (nothing happens if it already exists)
+    return ("CREATE TABLE IF NOT EXISTS `{}` (\n"
+            "  `id` BIGINT AUTO_INCREMENT PRIMARY KEY,\n"
+            "  `node` VARCHAR(32) NOT NULL,\n"
+            "  `field` VARCHAR(64) NOT NULL,\n"
+            "  `window_length` INT NOT NULL,\n"
+            "  `window_start` DATETIME NOT NULL,\n"
+            "  `samples` INT NOT NULL,\n"
+            "  `min_value` DOUBLE,\n"
+            "  `max_value` DOUBLE,\n"
+            "  `mean_value` DOUBLE,\n"
+            "  `last_value` DOUBLE,\n"
+            "  KEY (`window_start`),\n"
+            "  KEY (`node`, `field`, `window_start`)\n"
+            ");".format(table))
+
+class Accumulator:
+    __slots__ = ("start", "count", "total", "min", "max", "last")
+
+    def __init__(self,start):
+        self.start = start  # start of the window (epoch seconds)
+        self.count, self.total = 0, 0
+        self.min = self.max = self.last = None
+
+    def add(self,value):
+        self.count += 1
+        self.total += value
+        if self.count == 1 or value < self.min: self.min = value
+        if self.count == 1 or value > self.max: self.max = value
+        self.last = value
+
+    def merge(self,other):
+        # Add a closed window that comes after the samples already added
+        if other.count == 0: return
+        if self.count == 0 or other.min < self.min: self.min = other.min
+        if self.count == 0 or other.max > self.max: self.max = other.max
+        self.count += other.count
+        self.total += other.total
+        self.last = other.last
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+class Rollup:
+    def __init__(self,windows=[60,900]):
+        # windows: length of each level (in seconds), each one a multiple of the previous one
+        for short, long in zip(windows, windows[1:]):
+            if long % short: raise ValueError("rollup window {} is not a multiple of {}".format(long, short))
+        self.windows = list(windows)
+        self._open = [{} for _ in windows]  # per level, (node, field): Accumulator of the window being filled
+        self._due = [None for _ in windows] # per level, end of the earliest open window
+        self._last = {}     # (node, field): time of the last sample, to skip fields that were not read again
+        self._closed = []   # rows of the windows closed by append() (a sample of a later window came first)
+
+    def append(self,series,timestamp,value):
+        # Add one sample (time in epoch seconds) to the window of the first level
+        if timestamp <= self._last.get(series, -1): return
+        self._last[series] = timestamp
+        window = self.windows[0]
+        start = timestamp - timestamp % window
+        acc = self._open[0].get(series)
+        if acc is None or acc.start != start:
+            if acc is not None: self._close(0, series, acc, self._closed)
+            acc = self._open[0][series] = Accumulator(start)
+            if self._due[0] is None or start + window < self._due[0]: self._due[0] = start + window
+        acc.add(value)
+
+    def append_nodes(self,server,snapshots):
+        # Add every valid field of the snapshot of each node (as returned by BusPoller.read)
+        for node, snapshot in zip(server, snapshots):
+            for name, value, timestamp in snapshot.fields():
+                self.append((node._name, name), timestamp, value)
+
+    def _close(self,level,series,acc,rows):
+        window = self.windows[level]
+        rows.append((window, series, acc))
+        if level + 1 < len(self.windows):
+            # Merge the closed window into the window of the next level
+            longer = self.windows[level + 1]
+            start = acc.start - acc.start % longer
+            parent = self._open[level + 1].get(series)
+            if parent is None or parent.start != start:
+                if parent is not None: self._close(level + 1, series, parent, rows)
+                parent = self._open[level + 1][series] = Accumulator(start)
+                if self._due[level + 1] is None or start + longer < self._due[level + 1]: self._due[level + 1] = start + longer
+            parent.merge(acc)
+
+    def close(self,now):
+        # Close the windows that end before 'now' (epoch seconds), shortest first, and return their rows as
+        # (window length, (node, field), Accumulator)
+        rows, self._closed = self._closed, []
+        for level, window in enumerate(self.windows):
+            if self._due[level] is None or now < self._due[level]: continue
+            due = None
+            for series, acc in list(self._open[level].items()):
+                if acc.start + window <= now:
+                    del self._open[level][series]
+                    self._close(level, series, acc, rows)
+                elif due is None or acc.start + window < due: due = acc.start + window
+            self._due[level] = due
+        return rows
+
+def to_row(window,series,acc):
+    # Data of a closed window in the order of 'title'
+    return (series[0], series[1], window, datetime.datetime.fromtimestamp(acc.start).strftime("%Y-%m-%d %H:%M:%S"),
+            acc.count, acc.min, acc.max, acc.mean(), acc.last)
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) != 2:
+        print("usage: python3 rollup.py <table>   (prints the CREATE TABLE statement of the rollup table)"); sys.exit(1)
+    print(create_table(sys.argv[1]))
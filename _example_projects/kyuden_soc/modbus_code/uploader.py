@@ -0,0 +1,123 @@
+"""
+#title           :uploader.py
+#description     :upload the rows of the outbox to the MySQL database over one long-lived connection
+#author          :Nicholas Putra Rihandoko
+#date            :2026/10/18
+#version         :0.1
+#usage           :Energy Monitoring System
+#notes           :rows are inserted in batches (multi-row INSERT through executemany), one commit per batch
+#python_version  :3.7.3
+#==============================================================================
+"""
+
+import pymysql
+import time
+
+# MySQL error codes of the data of a row, the only errors that get a row rejected (see Uploader.is_refused)
+REFUSED = (1048, 1062, 1136, 1264, 1265, 1366, 1406)
+
+def open_mysql(mysql_server,timeout=2):
+    # Connect to the MySQL server, every socket operation (connecting, sending a query, waiting for its result)
+    # is bound by the timeout (in seconds, may be a fraction), so it can be used from any thread
+    return pymysql.connect(host=mysql_server["host"], user=mysql_server["user"], password=mysql_server["password"], db=mysql_server["db"], port=mysql_server["port"],
+                           connect_timeout=timeout, read_timeout=timeout, write_timeout=timeout)
+
+class Uploader:
+    def __init__(self,mysql_server,outbox,batch=500,flush_interval=0,timeout=2,backoff=[1,300]):
+        self._server = mysql_server
+        self._outbox = outbox
+        self._db = None
+        self.batch = batch                  # the maximum number of rows uploaded in a single command
+        self.flush_interval = flush_interval  # the minimum period between two uploads, unless a full batch is waiting (in seconds)
+        self.timeout = timeout              # the maximum time of each socket operation of the connection (in seconds)
+        self.backoff = backoff              # [first, maximum] wait before connecting again after a failure (in seconds)
+        self._wait = backoff[0]
+        self._retry = 0                     # time before which no new connection is tried
+        self._flush = None                  # time of the last upload
+        self.batch_time = None              # duration of the last batch (in seconds)
+        self.rate = None                    # rows per second of the last upload
+        self.sent = 0                       # total rows uploaded since start-up
+
+    def error(self,e):
+        # Print the error message
+        print("problem with MySQL Server:")
+        print(e)
+        print("<===== ===== continuing ===== =====>")
+        print("")
+
+    def close(self):
+        if self._db is not None:
+            try: self._db.close()
+            except Exception: pass
+            self._db = None
+
+    def fail(self,e):
+        # Drop the connection and wait longer before each new connection attempt
+        self.error(e)
+        self.close()
+        self._retry = time.monotonic() + self._wait
+        self._wait = min(2*self._wait, self.backoff[1])
+
+    def connect(self):
+        # Return True once there is a healthy connection
+        if self._db is not None:
+            # Health check of the kept connection
+            try:
+                self._db.ping(reconnect=False)
+                return True
+            except Exception: self.close()
+        if time.monotonic() < self._retry: return False
+        try:
+            self._db = open_mysql(self._server, self.timeout)
+            self._wait = self.backoff[0]
+            return True
+        except Exception as e:
+            self.fail(e)
+            return False
+
+    def is_refused(self,e):
+        # True if the server refuses the data of a row (the same rows would always fail): wrong number of columns
+        # (1136), NULL in a NOT NULL column (1048), duplicate key (1062), value out of range (1264), truncated or
+        # wrong value (1265, 1366), data too long (1406), or a row that pymysql can not format. Any other error
+        # (lost connection, missing table, lock wait/deadlock, permission, read-only or full server...) is not
+        # caused by the rows: they stay in the outbox and the upload is tried again later
+        if isinstance(e, pymysql.err.MySQLError):
+            return bool(e.args) and e.args[0] in REFUSED
+        return isinstance(e, (TypeError, ValueError))
+
+    def send(self,mysql_query,rows):
+        # Insert and commit one batch of rows, False if the upload has to wait (the rows stay in the outbox)
+        start = time.monotonic()
+        try:
+            with self._db.cursor() as cursor:
+                cursor.executemany(mysql_query,rows)
+            self._db.commit()
+        except Exception as e:
+            if not self.is_refused(e):
+                # Includes a timeout
+                self.fail(e)
+                return False
+            # The server refuses the data, let the outbox find the refused row
+            try: self._db.rollback()
+            except Exception as r:
+                self.fail(r)
+                return False
+            raise
+        self.batch_time = time.monotonic() - start
+        return True
+
+    def flush(self,force=False):
+        # Upload the waiting rows once per flush_interval, or at once when a full batch is waiting
+        now = time.monotonic()
+        pending = self._outbox.pending()
+        if pending == 0: return 0
+        if not force and self._flush is not None and now - self._flush < self.flush_interval and pending < self.batch: return 0
+        if not self.connect(): return 0
+        self._flush = now
+        sent = self._outbox.drain(self.send, self.batch)
+        if sent:
+            self.sent += sent
+            self.rate = sent / max(time.monotonic() - now, 1e-6)
+            print("<===== {} rows of data are sent to database ({:.0f} rows/s, {:.0f} ms per batch) =====>".format(sent, self.rate, 1000*self.batch_time))
+            print("")
+        return sent
@@ -0,0 +1,98 @@
+"""
+#title           :console.py
+#description     :console output of each polling cycle (off, one summary line per node, changed fields only, or full dump)
+#author          :Nicholas Putra Rihandoko
+#date            :2026/10/18
+#version         :0.1
+#usage           :Energy Monitoring System
+#notes           :the output of a cycle is formatted with templates built once per node/field and written at once
+#python_version  :3.7.3
+#==============================================================================
+"""
+
+import sys
+import time
+
+class Console:
+    # Modes:
+    #   "off"     : nothing
+    #   "summary" : one line per node (number of valid fields, the first 'fields' of the node, or its error)
+    #   "changes" : the fields whose value changed since the previous cycle, one line per node
+    #   "full"    : every field of every node (as query.print_response), once every 'period' seconds
+    modes = ("off", "summary", "changes", "full")
+
+    def __init__(self,mode="summary",period=0,fields=3,stream=None):
+        if mode not in self.modes: raise ValueError("unknown console mode '{}'".format(mode))
+        self.mode = mode
+        self.period = period    # the period of the full dump (in seconds, 0 for every cycle)
+        self.fields = fields    # the number of fields on a summary line
+        self._stream = stream or sys.stdout
+        self._last = {}         # node name: {field: value} shown last ("changes" mode)
+        self._shown = None      # time of the last full dump
+        self._field = {}        # (node, field, mode): template of one field
+        self._header = {}       # node name: template of the header of the full dump
+
+    def field(self,node,name,mode):
+        key = (node, name, mode)
+        template = self._field.get(key)
+        if template is None:
+            if mode == "full": template = name + " = {}\n"
+            elif mode == "changes": template = " " + name + " {} -> {}"
+            else: template = " " + name + "={}"
+            self._field[key] = template
+        return template
+
+    def header(self,node):
+        template = self._header.get(node)
+        if template is None:
+            template = self._header[node] = node + " MEASUREMENTS\nTime             : {}\nCPU Temperature  : {} degC\n"
+        return template
+
+    def show(self,server,snapshots,timer,error=None,cpu_temp=None):
+        # Write the output of one polling cycle: snapshots as returned by BusPoller.read, error the BusPoller.error,
+        # cpu_temp a function that reads the CPU temperature (only called for a full dump)
+        if self.mode == "off": return
+        error = error or {}
+        if self.mode == "full":
+            now = time.monotonic()
+            if self._shown is not None and now - self._shown < self.period: return
+            self._shown = now
+            text = self.full(server, snapshots, timer, cpu_temp() if cpu_temp else None)
+        else:
+            stamp = timer.strftime("%H:%M:%S")
+            text = "".join(self.line(node._name, snapshot, stamp, error.get(node._name)) for node, snapshot in zip(server, snapshots))
+        if text:
+            self._stream.write(text)
+            self._stream.flush()
+
+    def line(self,node,snapshot,stamp,error=None):
+        if error is not None: return "{} {}: failed ({})\n".format(stamp, node, error)
+        if self.mode == "summary":
+            count, parts = 0, []
+            for name, value, timestamp in snapshot.fields():
+                if count < self.fields: parts.append(self.field(node, name, "summary").format(value))
+                count += 1
+            return "{} {}: {} fields{}\n".format(stamp, node, count, "".join(parts))
+        # "changes"
+        last = self._last.setdefault(node, {})
+        parts = []
+        for name, value, timestamp in snapshot.fields():
+            old = last.get(name)
+            if old != value:
+                parts.append(self.field(node, name, "changes").format(old, value))
+                last[name] = value
+        return "{} {}:{}\n".format(stamp, node, "".join(parts)) if parts else ""
+
+    def full(self,server,snapshots,timer,cpu_temp=None):
+        # Same layout as query.print_response, built as one string
+        stamp = timer.strftime("%d/%m/%Y-%H:%M:%S")
+        text = []
+        for node, snapshot in zip(server, snapshots):
+            name = node._name
+            text.append(self.header(name).format(stamp, cpu_temp))
+            for attr_name, attr_value in snapshot.items():
+                if isinstance(attr_value, list) and attr_value and isinstance(attr_value[0], list):
+                    text.extend("{} {} = {}\n".format(attr_name, j+1, value) for j, value in enumerate(attr_value))
+                else: text.append(self.field(name, attr_name, "full").format(attr_value))
+            text.append("\n")
+        return "".join(text)
@@ -0,0 +1,730 @@
+"""
+#title           :modbus_node.py
+#description     :modbus engine shared by every device library (read plans, block planner, decoder, register index, measurement store)
+#author          :Nicholas Putra Rihandoko
+#date            :2026/10/18
+#version         :2.0
+#usage           :Energy Monitoring System
+#notes           :a device library only declares its register map, see OMRON_KM-N1-FLK/code/omron_KMN1FLK.py
+#python_version  :3.7.3
+#==============================================================================
+"""
+import time
+import asyncio
+import inspect
+import bisect
+import struct
+from array import array
+from types import MappingProxyType
+
+# FUNCTION CODE PYMODBUS SYNTAX
+# 0x03 (3) = read_holding_registers
+# 0x04 (4) = read_input_registers
+# 0x06 (6) = write_register
+# 0x10 (16) = write_registers
+
+class Node:
+    # Register map of the device, declared by the device library as class attributes:
+    increment   = 1     # address increment (1 = 16-bit registers, 2 = 32-bit registers)
+    memory_dict = {}    # commands and memory address, {name: {"fc", "address", "scale", "bias", "round"/"param"}}
+    extra_calc  = {}    # parameters/data that are not readily available from Modbus ("compile" or calculated)
+    forbidden   = []    # address ranges [first, last] of the device that must never be read
+    # Called with a Transaction record after each command (None to turn it off), for every node when set on the
+    # class, e.g. Node.probe = instrument.Instrument([...]), or for one node when set on the node
+    probe       = None
+    # Compiled read plans kept per node, the least recently used one is dropped beyond it (e.g. a scheduler that
+    # reads a different set of items each cycle)
+    max_plans   = 64
+
+    def __init__(self,unit,name,client,delay=200,max_count=20,increment=None,shift=0,baudrate=9600,overhead=10,forbidden=None,adaptive=True):
+        self._name                      = name
+        self._unit                      = unit
+        self._client                    = client
+        self._client_transmission_delay = delay/1000    # in seconds, starting turnaround margin of the slave when adaptive
+        self._max_count                 = max_count     # maximum read/write address count in a single command
+        self._shift                     = shift         # address shift
+        self._inc                       = increment if increment is not None else self.increment   # address increment
+        self._baudrate                  = baudrate      # serial speed (in bits per second), used to estimate the time of each command
+        self._frame_overhead            = overhead/1000 # fixed cost of each command on top of its transmission and delay (in seconds)
+        # Address ranges [first, last] that must never be read, even to fill a gap between two read address
+        self._forbidden                 = sorted([r[0]+shift, r[1]+shift] for r in self.forbidden + (forbidden or []))
+        # Used to shift the Modbus memory address for some devices
+        self._memory_dict = {key: dict(value, address=value["address"]+shift) for key, value in self.memory_dict.items()}
+        self._extra_calc = self.extra_calc
+        # Pacing of the commands sent to this slave (silent interval of the bus + learned turnaround margin)
+        self._pacer = FramePacer(id(client), baudrate, self._client_transmission_delay, adaptive)
+        # Freeze the register map once the address shift is applied, so the indexes below never go stale
+        self._memory_dict = MappingProxyType({key: MappingProxyType(value) for key, value in self._memory_dict.items()})
+        # Index the register map by lowercase name and by address (the first entry wins, as in the register map order)
+        self._name_index, self._address_index = {}, {}
+        for key, value in self._memory_dict.items():
+            self._name_index.setdefault(key.lower(), key)
+            self._address_index.setdefault(value["address"], key)
+        self._sorted_address = sorted(self._address_index)   # for address range queries
+        self._extra_index = {key.lower(): key for key in self._extra_calc}
+        self._unit_keyword = {}     # keyword of the slave id of each client command, see unit_keyword()
+        # Fields that share their name with a calculated parameter (e.g. Battery_Voltage of the TriStar is scaled by
+        # V_PU): the store keeps the calculated value, their last register value is kept here for the calculation
+        self._shadowed = set(self._memory_dict) & set(self._extra_calc)
+        self._raw = {}
+        # Compiled read plans, cached by the normalized read request (least recently used first)
+        self._read_plan = {}
+        # Readings are kept in a fixed-layout store (one slot per read field and calculated parameter),
+        # the object's attributes are only a view over it
+        blueprint = {key: value["compile"] for key, value in self._extra_calc.items() if value.get("compile") is not None}
+        self._store = MeasurementStore([key for key, value in self._memory_dict.items() if value["fc"] in (0x03, 0x04)]
+                                        + [key for key in self._extra_calc if key not in blueprint], blueprint)
+
+    def __getattr__(self,name):
+        # Only called when the attribute is not found normally, i.e. for readings
+        if name.startswith("_"): raise AttributeError(name)
+        return self._store.get(name)
+
+    def snapshot(self):
+        # Copy of the current readings (see MeasurementStore.snapshot)
+        return self._store.snapshot()
+
+    def get_read_attr(self):
+        # get all the attribute data that have been read from server (or calculated)
+        return self._store.items()
+
+    def reset_read_attr(self):
+        # Reset (and/or initiate) object's attributes: every reading is forgotten until it is read again
+        self._store.reset()
+        self._raw = {}
+
+    def map_read_attr(self,raw_address):
+        # get the attribute data using its Modbus memory address
+        mapped_addr = []
+        for a in raw_address:
+            key = self._address_index.get(a)
+            if key is not None:
+                try: mapped_addr.append([key, getattr(self, key)])
+                except: print(" -- one or more mapped address has not been read from server --")
+        return mapped_addr
+
+    def find_address(self,first,last):
+        # get the register map entries whose address is within [first, last]
+        lo = bisect.bisect_left(self._sorted_address, first)
+        hi = bisect.bisect_right(self._sorted_address, last)
+        return [self._address_index[a] for a in self._sorted_address[lo:hi]]
+
+    def get_dependency(self,name):
+        # Value of a dependency of a calculated parameter, the register value for a field (never a value that has
+        # already been calculated, even when a calculated parameter has the same name)
+        if name in self._shadowed:
+            val = self._raw.get(name)
+            if val is None: raise AttributeError(name)
+            return val
+        return getattr(self, name)
+
+    def handle_extra_calculation(self,extras=None):
+        # Additional computation for self._extra_calc parameters, only the ones in extras when given
+        # (e.g. ReadPlan.extras, whose dependencies have just been read)
+        # (the "compile" parameters are arrays built from self._store when they are accessed)
+        timestamp = time.time()
+        for key in (self._extra_calc if extras is None else extras):
+            value = self._extra_calc[key]
+            if value.get("compile") is None:
+                val = 1
+                # Calculate the parameters, assign it to new attribute, skip if dependency not met
+                try:
+                    for scale in value["scale_dep"]:
+                        dep = self.get_dependency(scale[1])
+                        if dep != 0:
+                            val *= dep**scale[0]
+                        else: val = 0
+                    for bias in value["bias_dep"]:
+                        val += bias[0]*self.get_dependency(bias[1])
+                    val = round(val * value["scale"] + value["bias"], value["round"])
+                    if value["limit"]:
+                        if val < value["limit"][0]: val = value["limit"][1]
+                    self._store.set(key, val, timestamp)
+                except AttributeError: pass
+
+    def save_read(self,response,decoder):
+        # Decode a whole response block at once and save the values to the object's store
+        values = decoder.decode(response)
+        self._store.set_many(decoder.ids, values, time.time())
+        if self._shadowed:
+            for name, val in zip(decoder.names, values):
+                if name in self._shadowed: self._raw[name] = val
+
+    def count_address(self,fc,raw_address):
+        # Configure the read address (final_addr) and the attribute name where the read value is saved (final_save)
+        address, final_addr, save, final_save = [], [], [], []
+
+        # Match the address with the information in self._memory_dict library
+        matched = set()
+        for a in raw_address:
+            key = self._name_index.get(a) if isinstance(a,str) else self._address_index.get(a)
+            if key is None:
+                # If the address is not available in the library, then use it as is
+                if isinstance(a,str):
+                    print(" -- unrecognized address for '{}' --".format(a))
+                else:
+                    address.append(a); save.append('Hx'+hex(a)[2:].zfill(4).upper())
+                    print(" -- address '{}' may gives raw data, use with discretion --".format(save[-1]))
+            elif key not in matched:
+                matched.add(key)
+                address.append(self._memory_dict[key]["address"]); save.append(key)
+                if fc == None: fc = self._memory_dict[key]["fc"]
+
+        # Divide the address to be read into several command based on the estimated transaction time
+        address, save = zip(*sorted(zip(address, save)))
+        address, save = list(address), list(save)
+        i = 0
+        for first, last in self.plan_blocks(sorted(set(address))):
+            temp_addr, temp_save = [], []
+            while i < len(address) and address[i] <= last:
+                temp_addr.append(address[i]); temp_save.append(save[i]); i += 1
+            final_addr.append(temp_addr); final_save.append(temp_save)
+        return fc, final_addr, final_save
+
+    def transaction_time(self,count):
+        # Estimated time (in seconds) of a read command of 'count' registers until the next command can be sent
+        # request (8 bytes) + response (5 bytes + 2 bytes per register) + 3.5 characters of silence after each frame,
+        # with 11 bits per character in Modbus RTU, plus the current turnaround margin of the slave (see FramePacer)
+        return (20 + 2*count) * 11 / self._baudrate + self._frame_overhead + self._pacer.margin
+
+    def plan_blocks(self,address):
+        # Group the sorted (unique) address into read blocks [first, last] with the least total transaction time.
+        # The unused registers between two address are read along when it is cheaper than sending another command,
+        # as long as the block stays within max_count and does not touch a forbidden address range
+        n = len(address)
+        blocked = [False] * n
+        for k in range(n-1):
+            lo, hi = address[k] + self._inc, address[k+1] - 1
+            blocked[k] = any(f[0] <= hi and f[1] >= lo for f in self._forbidden)
+        cost, cut = [0.0] + [None]*n, [0]*(n+1)
+        for j in range(n):
+            i = j
+            while i >= 0:
+                count = address[j] - address[i] + self._inc
+                if count > self._max_count and i < j: break
+                t = cost[i] + self.transaction_time(count)
+                if cost[j+1] is None or t < cost[j+1]: cost[j+1], cut[j+1] = t, i
+                if i == 0 or blocked[i-1]: break
+                i -= 1
+        blocks, j = [], n
+        while j > 0:
+            blocks.append([address[cut[j]], address[j-1]]); j = cut[j]
+        return blocks[::-1]
+
+    def compile_read_plan(self,fc,address):
+        # Resolve the read address once into a fixed list of (fc, start, count, decoder) blocks
+        fc, addr, save = self.count_address(fc,address)
+        blocks = []
+        if fc in (0x03, 0x04):
+            for i, a in enumerate(addr):
+                count = a[-1]-a[0]+self._inc
+                fields = []
+                for s in save[i]:
+                    if s.startswith('Hx'): fields.append((int(s[2:],16)-a[0], s, 1, 0, None, True))
+                    else:
+                        value = self._memory_dict[s]
+                        fields.append((value["address"]-a[0], s, value["scale"], value["bias"], value["round"], value.get("signed", True)))
+                blocks.append((fc, a[0], count, BlockDecoder(count, self._inc, fields, [self._store.add(f[1]) for f in fields])))
+        return ReadPlan(fc, blocks, self.plan_extras([s for names in save for s in names] if blocks else []))
+
+    def plan_extras(self,names):
+        # Calculated parameters (in the self._extra_calc order) whose dependencies are all read by a plan of the
+        # read fields 'names', directly or through another calculated parameter of the plan. The others keep their
+        # last value (and time) instead of being calculated again from stale fields
+        read, extras = set(names), []
+        for key, value in self._extra_calc.items():
+            if value.get("compile") is None and all(d[1] in read for d in value["scale_dep"] + value["bias_dep"]):
+                extras.append(key); read.add(key)
+        return tuple(extras)
+
+    def get_read_plan(self,fc,address):
+        # Reuse the compiled read plan of a previous poll with the same request
+        key = (fc, tuple(address))
+        plan = self._read_plan.pop(key, None)
+        if plan is None:
+            address = list(address)
+            for a in key[1]:
+                k = self._extra_index.get(a)
+                if k is not None and a in address:
+                    try: extra = self.handle_dependency(self._extra_calc[k]["compile"])
+                    except KeyError: extra = self.handle_dependency([k])
+                    address.extend(extra); address.remove(a)
+            plan = self.compile_read_plan(fc, address)
+            while len(self._read_plan) >= max(1, self.max_plans): del self._read_plan[next(iter(self._read_plan))]
+        self._read_plan[key] = plan
+        return plan
+
+    def get_footprint(self,address):
+        # Function code and sorted register address read for one item of a read request (a field, a raw address,
+        # a calculated or "compile" parameter), e.g. for a scheduler to know which items share a read block
+        plan = self.get_read_plan(None, self.normalize_address([address]))
+        registers = set()
+        for fc, start, count, decoder in plan.blocks:
+            for name in decoder.names:
+                registers.add(int(name[2:],16) if name.startswith('Hx') else self._memory_dict[name]["address"])
+        return plan.fc, sorted(registers)
+
+    def can_read_block(self,first,last):
+        # True if the address first..last can be read in a single command
+        return last - first + self._inc <= self._max_count and not any(f[0] <= last and f[1] >= first for f in self._forbidden)
+
+    def unit_keyword(self,command):
+        # Keyword of the slave id of a client command: 'unit' in pymodbus 2.x, 'slave' in pymodbus 3.x and
+        # 'device_id' from pymodbus 3.10, found once from the signature of the command
+        name = getattr(command, "__name__", None)
+        keyword = self._unit_keyword.get(name)
+        if keyword is None:
+            try: parameters = inspect.signature(command).parameters
+            except (TypeError, ValueError): parameters = {}
+            keyword = next((k for k in ("device_id", "slave", "unit") if k in parameters), "unit")
+            self._unit_keyword[name] = keyword
+        return keyword
+
+    def transaction(self,fc,command,**kwargs):
+        # Send one command once the line has been silent long enough for this slave
+        wait, retries = self._pacer.wait_time(), self._pacer.failures
+        time.sleep(wait)
+        self._pacer.begin()
+        start = time.monotonic()
+        try:
+            response = command(**{self.unit_keyword(command): self._unit}, **kwargs)
+        except Exception as e:
+            self._pacer.end(False)
+            if self.probe is not None: self.report(fc, kwargs, start, wait, retries, None, e)
+            raise
+        self._pacer.end(is_answered(response))
+        if self.probe is not None: self.report(fc, kwargs, start, wait, retries, response)
+        return response
+
+    def report(self,fc,kwargs,start,wait,retries,response,error=None):
+        # Hand the record of one command over to the probe, a failing probe never stops the polling
+        try: self.probe(Transaction(self, fc, kwargs, time.monotonic() - start, wait, retries, response, error))
+        except Exception as e: print(" -- transaction probe failed: {} --".format(e))
+
+    def get_pacing(self):
+        # Pacing metric of this slave (in seconds): silent interval, learned margin, achieved idle time before each command
+        return self._pacer.metric()
+
+    def reading_sequence(self,fc,address):
+        response = None
+        plan = self.get_read_plan(fc,address)
+        # Send the command and read response with function_code 0x03 (3) or 0x04 (4)
+        for fc, start, count, decoder in plan.blocks:
+            if fc == 0x03:
+                response = self.transaction(0x03, self._client.read_holding_registers, address=start, count=count)
+            else:
+                response = self.transaction(0x04, self._client.read_input_registers, address=start, count=count)
+            self.save_read(response.registers,decoder)
+        self.finish_read(plan)
+        return response
+
+    def finish_read(self,plan):
+        if not plan.blocks: print(" -- function code needs to be declared for this list of read address --")
+        self.handle_extra_calculation(plan.extras)
+
+    def handle_multiple_writting(self,param):
+        # convert parameter input into hexadecimal format based on address increment
+        if param < 0: hex_param = hex((abs(param) ^ ((1 << (16*self._inc)) - 1)) + 1)[2:].zfill(4*self._inc)
+        else: hex_param = hex(param)[2:].zfill(4*self._inc)
+        values = [int(hex_param[i:i+4], 16) for i in range(0, 4*self._inc, 4)]
+        return values
+
+    def handle_write_param(self,param):
+        # convert parameter input (a number or a list of numbers) into the register values to be written
+        if isinstance(param, list):
+            params = []
+            for p in param: params.extend(self.handle_multiple_writting(p))
+        else: params = self.handle_multiple_writting(param)
+        return params
+
+    def writting_sequence(self,fc,address,param):
+        response = None
+        params = self.handle_write_param(param)
+        # Send the command with function_code 0x06 (6) or 0x10 (16)
+        if fc == 0x06:
+            response = self.transaction(0x06, self._client.write_register, address=address, value=param)
+        elif fc == 0x10:
+            response = self.transaction(0x10, self._client.write_registers, address=address, values=params)
+        return response
+
+    def handle_dependency(self,raw_address):
+        # create list of read address based on the dependent parameters in self._extra_calc
+        result = []
+        for item in raw_address:
+            if isinstance(item, list):
+                result.extend(self.handle_dependency(item))
+            else:
+                if self._extra_calc.get(item):
+                    for d in self._extra_calc.get(item)["scale_dep"] + self._extra_calc.get(item)["bias_dep"]:
+                        # Follow dependencies that are themselves calculated (e.g. V_PU for Battery_Voltage)
+                        if d[1] != item and d[1] not in self._memory_dict and self._extra_calc.get(d[1]):
+                            result.extend(self.handle_dependency([d[1]]))
+                        else: result.append(d[1].lower())
+                else: result.append(item.lower())
+        return result
+
+    def normalize_address(self,address):
+        # lowercase names and shifted raw address, as used by the read plans
+        return [a.lower() if isinstance(a,str) else (a + self._shift) for a in address]
+
+    def resolve_write(self,address,param=None,fc=None):
+        # Get the (name, fc, address, param) to be written, None if the input argument is incomplete
+        if not isinstance(address,str): address += self._shift
+        key = self._name_index.get(address.lower()) if isinstance(address,str) else self._address_index.get(address)
+        if key is not None:
+            value = self._memory_dict[key]
+            address = value["address"]
+            if fc == None:
+                fc = value["fc"]
+            if param == None:
+                if value.get("param") is not None:
+                    param = value["param"]
+                else:
+                    print(" -- no parameter to be written --"); return None
+            else:
+                if value.get("scale") is not None:
+                    param = param*value["scale"]
+
+        if (fc == None) or (param == None) or isinstance(address,str):
+            print(" -- incomplete input argument -- "); return None
+        return key, fc, address, param
+
+    def read(self,address,fc=None):
+        # Send the command and read response with function_code 0x03 (3) or 0x04 (4)
+        return self.reading_sequence(fc, self.normalize_address(address))
+
+    def write(self,address,param=None,fc=None):
+        # start writting sequence to send command with function_code 0x06 (6) or 0x10 (16)
+        command = self.resolve_write(address,param,fc)
+        if command is None: return None
+        key, fc, address, param = command
+        response = self.writting_sequence(fc, address, param)
+        print("{} ({}) get: {}".format(key, str(hex(address)), response))
+        return response
+
+    def send_command(self,command,address,param=None,fc=None):
+        if command == "read": return self.read(address,fc)
+        elif command == "write": return self.write(address,param,fc)
+        else: print("-- unrecognized command --")
+
+class AsyncNode(Node):
+    # asyncio variant of Node for a pymodbus asyncio client (serial or TCP), e.g. to poll several buses or upload to
+    # the database while waiting for a response. It shares the register map, read plans and decoding of Node,
+    # only the commands are awaited and the pacing between commands is an asyncio.sleep
+    _bus_lock = {}  # one lock per client, so the commands of the nodes on the same bus are never interleaved
+
+    def get_client(self):
+        # pymodbus 2.x asyncio clients send the commands through their protocol, pymodbus 3.x clients directly
+        return getattr(self._client, "protocol", None) or self._client
+
+    def get_lock(self):
+        lock = AsyncNode._bus_lock.get(id(self._client))
+        if lock is None: lock = AsyncNode._bus_lock[id(self._client)] = asyncio.Lock()
+        return lock
+
+    async def transaction(self,fc,command,**kwargs):
+        wait, retries = self._pacer.wait_time(), self._pacer.failures
+        await asyncio.sleep(wait)
+        self._pacer.begin()
+        start = time.monotonic()
+        try:
+            response = await command(**{self.unit_keyword(command): self._unit}, **kwargs)
+        except Exception as e:
+            self._pacer.end(False)
+            if self.probe is not None: self.report(fc, kwargs, start, wait, retries, None, e)
+            raise
+        self._pacer.end(is_answered(response))
+        if self.probe is not None: self.report(fc, kwargs, start, wait, retries, response)
+        return response
+
+    async def reading_sequence(self,fc,address):
+        response = None
+        plan = self.get_read_plan(fc,address)
+        client = self.get_client()
+        # Send the command and read response with function_code 0x03 (3) or 0x04 (4)
+        async with self.get_lock():
+            for fc, start, count, decoder in plan.blocks:
+                if fc == 0x03:
+                    response = await self.transaction(0x03, client.read_holding_registers, address=start, count=count)
+                else:
+                    response = await self.transaction(0x04, client.read_input_registers, address=start, count=count)
+                self.save_read(response.registers,decoder)
+        self.finish_read(plan)
+        return response
+
+    async def writting_sequence(self,fc,address,param):
+        response = None
+        params = self.handle_write_param(param)
+        client = self.get_client()
+        # Send the command with function_code 0x06 (6) or 0x10 (16)
+        async with self.get_lock():
+            if fc == 0x06:
+                response = await self.transaction(0x06, client.write_register, address=address, value=param)
+            elif fc == 0x10:
+                response = await self.transaction(0x10, client.write_registers, address=address, values=params)
+        return response
+
+    async def read(self,address,fc=None):
+        return await self.reading_sequence(fc, self.normalize_address(address))
+
+    async def write(self,address,param=None,fc=None):
+        command = self.resolve_write(address,param,fc)
+        if command is None: return None
+        key, fc, address, param = command
+        response = await self.writting_sequence(fc, address, param)
+        print("{} ({}) get: {}".format(key, str(hex(address)), response))
+        return response
+
+    async def send_command(self,command,address,param=None,fc=None):
+        if command == "read": return await self.read(address,fc)
+        elif command == "write": return await self.write(address,param,fc)
+        else: print("-- unrecognized command --")
+
+def is_answered(response):
+    # True if the slave answered in time: a normal response or a Modbus exception response (which carries an
+    # exception code), False for a timeout or a frame with a bad CRC (pymodbus returns a ModbusIOException)
+    return not response.isError() or hasattr(response, "exception_code")
+
+class FramePacer:
+    # Inter-frame pacing of one slave. Modbus RTU only needs the line to be silent for 3.5 characters between two
+    # frames, some slaves need a bit more to turn around, so a margin is learned per slave: it grows after each
+    # timeout/CRC error and shrinks after each answered command, instead of a fixed delay after every command.
+    # It never shrinks below a floor: the smallest margin answered before the last failure, so once the turnaround
+    # of the slave is found the margin settles just above it instead of decaying into a timeout again and again
+    _bus_end = {}       # end time of the last command of each bus (client), shared by the slaves of the bus
+    shrink = 0.9        # margin factor after an answered command
+    grow = 2            # margin factor after a failed command (plus one silent interval)
+    max_margin = 1.0    # in seconds
+    smoothing = 0.2     # weight of the newest idle time in the pacing metric
+
+    def __init__(self,bus,baudrate,margin=0,adaptive=True):
+        self._bus = bus
+        # 3.5 characters of 11 bits, fixed to 1.75 ms above 19200 bps by the Modbus RTU specification
+        self.silent = 3.5 * 11 / baudrate if baudrate <= 19200 else 0.00175
+        self.margin = margin        # fixed margin when not adaptive (in seconds)
+        self.floor = 0              # smallest margin of an adaptive slave (in seconds)
+        self._answered = None       # smallest margin answered since the last failure
+        self.adaptive = adaptive
+        self.pacing = None          # smoothed idle time of the line before each command of this slave (in seconds)
+        self.commands = 0
+        self.errors = 0
+        self.failures = 0           # failed commands since the last answered one
+        self._end = None            # end time of the last command of this slave
+
+    def wait_time(self):
+        # Time (in seconds) to wait before the next command can be sent to this slave
+        now = time.monotonic()
+        due = FramePacer._bus_end.get(self._bus, now) + self.silent
+        if self._end is not None: due = max(due, self._end + self.silent + self.margin)
+        return max(0, due - now)
+
+    def begin(self):
+        # Called right before the command is sent, idle times longer than the maximum pacing are gaps between
+        # polling cycles and are left out of the metric
+        last = FramePacer._bus_end.get(self._bus)
+        if last is not None:
+            idle = time.monotonic() - last
+            if idle <= self.silent + self.max_margin:
+                self.pacing = idle if self.pacing is None else self.pacing + self.smoothing*(idle - self.pacing)
+        self.commands += 1
+
+    def end(self,answered):
+        # Called once the command is answered or failed
+        self._end = FramePacer._bus_end[self._bus] = time.monotonic()
+        if not answered: self.errors += 1
+        self.failures = 0 if answered else self.failures + 1
+        if self.adaptive:
+            if answered:
+                if self._answered is None or self.margin < self._answered: self._answered = self.margin
+                self.margin = max(self.floor, self.margin*self.shrink)
+            else:
+                # The smallest margin answered since the previous failure becomes the floor (a failure at the floor,
+                # e.g. noise on the line, leaves it as it is)
+                if self._answered is not None: self.floor = self._answered
+                self._answered = None
+                self.margin = min(self.max_margin, self.margin*self.grow + self.silent)
+
+    def metric(self):
+        return {"silent": self.silent, "margin": self.margin, "floor": self.floor, "pacing": self.pacing,
+                "commands": self.commands, "errors": self.errors}
+
+class Transaction:
+    # Record of one command, as handed to Node.probe. The frame sizes are the ones of Modbus RTU (a response of
+    # 0 bytes is a timeout), the latency is the round trip of the command in the client (in seconds)
+    __slots__ = ("time", "node", "unit", "fc", "address", "count", "request", "response", "latency", "sleep",
+                 "retries", "error", "exception_code")
+
+    def __init__(self,node,fc,kwargs,latency,sleep,retries,response,error=None):
+        self.time       = time.time()
+        self.node       = node._name
+        self.unit       = node._unit
+        self.fc         = fc
+        self.address    = kwargs.get("address")
+        self.count      = kwargs.get("count") or len(kwargs.get("values") or ()) or 1
+        self.request    = 9 + 2*self.count if fc == 0x10 else 8
+        self.latency    = latency
+        self.sleep      = sleep         # pacing wait before the command (in seconds)
+        self.retries    = retries       # failed commands to this slave right before this one
+        self.exception_code = None
+        if error is not None:
+            self.error, self.response = type(error).__name__, 0
+        elif response.isError():
+            self.error = type(response).__name__
+            self.exception_code = getattr(response, "exception_code", None)
+            self.response = 5 if self.exception_code is not None else 0
+        else:
+            self.error, self.response = None, 5 + 2*self.count if fc in (0x03, 0x04) else 8
+
+    def as_dict(self):
+        return {key: getattr(self, key) for key in self.__slots__}
+
+class ReadPlan:
+    # Read blocks of a read request, compiled once by Node.compile_read_plan() and replayed on every poll
+    __slots__ = ("fc", "blocks", "extras")
+
+    def __init__(self,fc,blocks,extras=()):
+        self.fc     = fc        # function code of the request
+        self.blocks = blocks    # list of (fc, start address, register count, decoder)
+        self.extras = extras    # calculated parameters to be calculated after the blocks are read
+
+
+class BlockDecoder:
+    # Decode every field of a read block in one pass: the registers are packed into bytes and unpacked with a
+    # struct format precomputed for the block (pad bytes for the unused registers), then scaled per field
+    __slots__ = ("names", "ids", "_raw", "_word", "_index", "_scale", "_bias", "_round")
+    # struct format of one value by address increment (1 = 16-bit, 2 = 32-bit, 4 = 64-bit), signed or unsigned
+    _format = {1: ("H", "h"), 2: ("I", "i"), 4: ("Q", "q")}
+
+    def __init__(self,count,increment,fields,ids=None):
+        # fields: list of (register offset, name, scale, bias, round, signed), sorted by offset
+        # ids: slot of each field in the node's MeasurementStore
+        self._raw = struct.Struct(">{}H".format(count))
+        fmt, pos, position, index = ">", 0, {}, []
+        for offset, name, scale, bias, rnd, signed in fields:
+            if offset not in position and offset >= pos and offset % increment == 0:
+                if offset > pos: fmt += "{}x".format(2*(offset-pos))
+                fmt += self._format[increment][signed]
+                position[offset] = len(position); pos = offset + increment
+            # Fields that are not aligned with the address increment can not be decoded (None)
+            index.append(position.get(offset))
+        # Pad bytes for the registers after the last decoded value (e.g. a trailing unaligned field)
+        if count > pos: fmt += "{}x".format(2*(count-pos))
+        self._word = struct.Struct(fmt)
+        self.names  = tuple(f[1] for f in fields)
+        self.ids    = tuple(ids) if ids is not None else None
+        self._index = tuple(index) if index != list(range(len(position))) else None
+        self._scale = tuple(f[2] for f in fields)
+        self._bias  = tuple(f[3] for f in fields)
+        self._round = tuple(f[4] for f in fields)
+
+    def decode(self,registers):
+        # Return the scaled values of the block fields, in the same order as self.names
+        words = self._word.unpack(self._raw.pack(*registers))
+        if self._index is not None:
+            words = [None if i is None else words[i] for i in self._index]
+        return [None if w is None else round(w * s + b, r) for w, s, b, r in zip(words, self._scale, self._bias, self._round)]
+
+
+class MeasurementStore:
+    # Fixed-layout storage of a node's readings: one float slot per field in a preallocated array, with a validity
+    # bitmap and the time (epoch seconds) each field was last saved. "compile" parameters are nested lists of
+    # field names that are built from the slots when accessed. A snapshot is a copy of the three buffers.
+    __slots__ = ("_id", "_names", "_compile", "_values", "_int", "_valid", "_time")
+
+    def __init__(self,names,blueprint=None):
+        self._names     = list(dict.fromkeys(names))
+        self._id        = {name: i for i, name in enumerate(self._names)}
+        self._compile   = blueprint or {}
+        self._values    = array("d", bytes(8*len(self._names)))
+        self._int       = bytearray(len(self._names))           # 1 if the saved value was an int
+        self._valid     = bytearray((len(self._names)+7)//8)
+        self._time      = array("d", bytes(8*len(self._names)))
+
+    def add(self,name):
+        # Get the slot of a field, appending one for a field outside the initial layout (e.g. raw 'Hx' address)
+        i = self._id.get(name)
+        if i is None:
+            # copy-on-write, as the name list and index are shared with the snapshots
+            self._names = self._names + [name]
+            self._id = dict(self._id); self._id[name] = i = len(self._id)
+            self._values.append(0); self._int.append(0); self._time.append(0)
+            if len(self._valid)*8 < len(self._names): self._valid.append(0)
+        return i
+
+    def set(self,name,val,timestamp):
+        self.set_many((self.add(name),), (val,), timestamp)
+
+    def set_many(self,ids,values,timestamp):
+        for i, val in zip(ids, values):
+            if val is None:
+                self._valid[i >> 3] &= ~(1 << (i & 7))
+            else:
+                self._values[i] = val
+                self._int[i] = val.__class__ is int
+                self._valid[i >> 3] |= 1 << (i & 7)
+                self._time[i] = timestamp
+
+    def is_valid(self,i):
+        return i < len(self._values) and bool(self._valid[i >> 3] & (1 << (i & 7)))
+
+    def _value(self,i):
+        return int(self._values[i]) if self._int[i] else self._values[i]
+
+    def _build_compile(self,blueprint):
+        # Nested list of the "compile" blueprint, None for the fields that have not been read
+        val = []
+        for item in blueprint:
+            if isinstance(item, list): val.append(self._build_compile(item))
+            else:
+                i = self._id.get(item)
+                val.append(self._value(i) if i is not None and self.is_valid(i) else None)
+        return val
+
+    def get(self,name):
+        i = self._id.get(name)
+        if i is not None and self.is_valid(i): return self._value(i)
+        if name in self._compile: return self._build_compile(self._compile[name])
+        raise AttributeError(name)
+
+    def __getattr__(self,name):
+        # Attribute-style access to the readings, e.g. snapshot.SOC
+        if name.startswith("_"): raise AttributeError(name)
+        return self.get(name)
+
+    def timestamp(self,name):
+        # Time (epoch seconds) the field was last saved, None if it has not been read
+        i = self._id.get(name)
+        return self._time[i] if i is not None and self.is_valid(i) else None
+
+    def reset(self):
+        # Forget the readings: every field is invalid (as if it had never been read) until it is saved again
+        self._values = array("d", bytes(8*len(self._values)))
+        self._int = bytearray(len(self._int))
+        self._valid = bytearray(len(self._valid))
+        self._time = array("d", bytes(8*len(self._time)))
+
+    def items(self):
+        # [name, value] of every valid field, then of every "compile" parameter with at least one valid field
+        items = [[name, self._value(i)] for i, name in enumerate(self._names) if self.is_valid(i)]
+        for key, blueprint in self._compile.items():
+            val = self._build_compile(blueprint)
+            if any(v is not None for v in self._flatten(val)): items.append([key, val])
+        return items
+
+    def fields(self):
+        # (name, value, timestamp) of every valid field, without the "compile" parameters
+        for i, name in enumerate(self._names):
+            if self.is_valid(i): yield name, self._value(i), self._time[i]
+
+    def _flatten(self,nested):
+        for item in nested:
+            if isinstance(item, list): yield from self._flatten(item)
+            else: yield item
+
+    def snapshot(self):
+        # Copy of the readings taken with a single copy of each buffer (the layout is shared, copy-on-write)
+        copy = MeasurementStore.__new__(MeasurementStore)
+        copy._names, copy._id, copy._compile = self._names, self._id, self._compile
+        copy._values, copy._int = array("d", self._values), bytearray(self._int)
+        copy._valid, copy._time = bytearray(self._valid), array("d", self._time)
+        return copy
@@ -0,0 +1,153 @@
+"""
+#title           :outbox.py
+#description     :durable queue (outbox) of the rows to be uploaded to the MySQL database
+#author          :Nicholas Putra Rihandoko
+#date            :2026/10/18
+#version         :0.1
+#usage           :Energy Monitoring System
+#notes           :rows are kept in a SQLite database (WAL journal) until they are committed on the MySQL server
+#python_version  :3.7.3
+#==============================================================================
+"""
+
+import sqlite3
+import json
+import datetime
+import threading
+
+def encode(value):
+    # Convert a value into a JSON value that MySQL accepts for the same column
+    if isinstance(value, datetime.timedelta):
+        # TIME column, as formatted by pymysql (hours may exceed 24)
+        seconds = int(value.total_seconds())
+        sign, seconds = ("-", -seconds) if seconds < 0 else ("", seconds)
+        return "{}{:02d}:{:02d}:{:02d}".format(sign, seconds // 3600, seconds // 60 % 60, seconds % 60)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)): return str(value)
+    return value
+
+class Outbox:
+    # Every row is committed to the local database before any upload is tried, and the cursor (id of the last
+    # uploaded row) only moves forward once the batch holding the row is committed on the MySQL server.
+    # Uploaded rows are deleted in the same transaction, so the database only holds the backlog.
+    # Rows are uploaded in order and at least once (a power loss between the two commits resends the last batch).
+    def __init__(self,path,batch=500):
+        self.batch = batch  # maximum number of rows uploaded in a single command
+        # The connection is shared by the poll loop and the upload worker, one statement/transaction at a time
+        self._lock = threading.RLock()
+        # Autocommit mode, the transactions below are explicit
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, query TEXT NOT NULL, data TEXT NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS cursor (id INTEGER PRIMARY KEY CHECK (id = 0), offset INTEGER NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS rejected (id INTEGER PRIMARY KEY, query TEXT NOT NULL, data TEXT NOT NULL, error TEXT)")
+        self._db.execute("INSERT OR IGNORE INTO cursor (id, offset) VALUES (0, 0)")
+
+    def put(self,query,data):
+        # Queue one row of data for the MySQL query
+        data = json.dumps([encode(d) for d in data])
+        with self._lock: self._db.execute("INSERT INTO outbox (query, data) VALUES (?, ?)", (query, data))
+
+    def put_many(self,query,rows):
+        # Queue several rows of data for the same MySQL query in a single transaction
+        rows = [(query, json.dumps([encode(d) for d in data])) for data in rows]
+        with self._lock, self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            self._db.executemany("INSERT INTO outbox (query, data) VALUES (?, ?)", rows)
+
+    def offset(self):
+        # id of the last uploaded row
+        with self._lock: return self._db.execute("SELECT offset FROM cursor WHERE id = 0").fetchone()[0]
+
+    def pending(self):
+        # Number of rows waiting to be uploaded
+        with self._lock: return self._db.execute("SELECT COUNT(*) FROM outbox WHERE id > ?", (self.offset(),)).fetchone()[0]
+
+    def peek(self,limit):
+        # Get the next rows to be uploaded as (id, query, data), oldest first
+        with self._lock:
+            rows = self._db.execute("SELECT id, query, data FROM outbox WHERE id > ? ORDER BY id LIMIT ?", (self.offset(), limit)).fetchall()
+        return [(i, query, json.loads(data)) for i, query, data in rows]
+
+    def commit(self,last):
+        # Move the cursor to the row id 'last' and delete the uploaded rows
+        with self._lock, self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            self._db.execute("UPDATE cursor SET offset = MAX(offset, ?) WHERE id = 0", (last,))
+            self._db.execute("DELETE FROM outbox WHERE id <= ?", (last,))
+
+    def reject(self,row,error):
+        # Move a row that the MySQL server refuses (e.g. wrong number of columns) aside, so it does not block the others
+        with self._lock, self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            self._db.execute("INSERT OR REPLACE INTO rejected (id, query, data, error) VALUES (?, ?, ?, ?)",
+                             (row[0], row[1], json.dumps(row[2]), str(error)))
+            self._db.execute("UPDATE cursor SET offset = MAX(offset, ?) WHERE id = 0", (row[0],))
+            self._db.execute("DELETE FROM outbox WHERE id <= ?", (row[0],))
+
+    def rejected(self):
+        # The rejected rows as (id, query, data, error), oldest first
+        with self._lock:
+            rows = self._db.execute("SELECT id, query, data, error FROM rejected ORDER BY id").fetchall()
+        return [(i, query, json.loads(data), error) for i, query, data, error in rows]
+
+    def requeue(self,ids=None):
+        # Queue the rejected rows (all of them, or the given ids) again at the end of the outbox, e.g. once the
+        # table is fixed. Return the number of rows queued again
+        where, args = "", ()
+        if ids is not None:
+            ids = list(ids)
+            if not ids: return 0
+            where, args = " WHERE id IN ({})".format(",".join("?" for _ in ids)), tuple(ids)
+        with self._lock, self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            count = self._db.execute("INSERT INTO outbox (query, data) SELECT query, data FROM rejected{} ORDER BY id".format(where), args).rowcount
+            self._db.execute("DELETE FROM rejected{}".format(where), args)
+        return count
+
+    def drain(self,send,batch=None):
+        # Upload the queued rows in batches of consecutive rows with the same query, until the outbox is empty or
+        # an upload fails. send(query, rows) uploads and commits one batch and returns True, False if the upload has
+        # to wait (the rows are kept), or raises an exception if the server refuses the data of a row (the refused
+        # rows are moved to the rejected table, see requeue()). Return the number of rows sent
+        sent = 0
+        while True:
+            rows = self.peek(batch or self.batch)
+            if not rows: return sent
+            n = 1
+            while n < len(rows) and rows[n][1] == rows[0][1]: n += 1
+            block = rows[:n]
+            try:
+                if not send(block[0][1], [r[2] for r in block]): return sent
+            except Exception:
+                # Find the refused row(s) by sending the block one row at a time
+                for row in block:
+                    try:
+                        if not send(row[1], [row[2]]): return sent
+                        sent += 1
+                    except Exception as e:
+                        print(" -- row {} is refused by the database: {} --".format(row[0], e))
+                        self.reject(row, e)
+                        continue
+                    self.commit(row[0])
+                continue
+            self.commit(block[-1][0])
+            sent += len(block)
+
+    def close(self):
+        with self._lock: self._db.close()
+
+if __name__ == "__main__":
+    import sys
+    # python3 outbox.py save/outbox.db            list the rejected rows
+    # python3 outbox.py save/outbox.db requeue    queue every rejected row again (or: requeue <id> <id> ...)
+    if len(sys.argv) < 2:
+        print("usage: python3 outbox.py <outbox.db> [requeue [id ...]]"); sys.exit(1)
+    box = Outbox(sys.argv[1])
+    if len(sys.argv) > 2 and sys.argv[2] == "requeue":
+        count = box.requeue([int(i) for i in sys.argv[3:]] if len(sys.argv) > 3 else None)
+        print(" -- {} rejected rows are queued again --".format(count))
+    else:
+        for row in box.rejected(): print("{} {} {} : {}".format(*row))
+        print(" -- {} rows waiting, {} rows rejected --".format(box.pending(), len(box.rejected())))
+    box.close()
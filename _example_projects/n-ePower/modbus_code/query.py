@@ -3,7 +3,7 @@
 #description     :custom functions for PyMySQL ant others
 #author          :Nicholas Putra Rihandoko
 #date            :2023/07/27
-#version         :0.1
+#version         :0.2
 #usage           :Python programming
 #notes           :
 #python_version  :3.7.3
@@ -11,11 +11,14 @@
 """
 
 import logging
-import pymysql
-import signal
 import datetime
 import csv
+import json
 import os
+import outbox
+import uploader
+import time
+import atexit
 
 #################################################################################################################
 # General function for debugging
@@ -26,10 +29,6 @@ def debugging():
     log = logging.getLogger()
     log.setLevel(logging.DEBUG)
 
-def handle_timeout(signum, frame):
-    raise TimeoutError("Execution timed out")
-signal.signal(signal.SIGALRM, handle_timeout)
-
 def get_cpu_temperature():
     # Read CPU temperature from file
     with open('/sys/class/thermal/thermal_zone0/temp', 'r') as f:
@@ -44,17 +43,16 @@ def print_response(server,timer):
         print(server[i]._name, "MEASUREMENTS")
         print("Time             :", timer.strftime("%d/%m/%Y-%H:%M:%S"))
         print("CPU Temperature  :", cpu_temp, "degC")
-        for attr_name, attr_value in vars(server[i]).items():
-            if not attr_name.startswith("_"):
-                if not isinstance(attr_value, list):
+        for attr_name, attr_value in server[i].get_read_attr():
+            if not isinstance(attr_value, list):
+                print(attr_name, "=", attr_value)
+            else:
+                #continue
+                if not isinstance(attr_value[0], list):
                     print(attr_name, "=", attr_value)
                 else:
-                    #continue
-                    if not isinstance(attr_value[0], list):
-                        print(attr_name, "=", attr_value)
-                    else:
-                        for i in range(len(attr_value)):
-                            print(attr_name, i+1, "=", attr_value[i])
+                    for j in range(len(attr_value)):
+                        print(attr_name, j+1, "=", attr_value[j])
         print("")
 
 #################################################################################################################
@@ -62,63 +60,86 @@ def print_response(server,timer):
 
 # Define the directory of the backup file and the data to be logged
 log_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'save')
-log_limit = 31
+log_limit = 31  # the number of days the data is kept in the log (in days)
+log_sync = 60   # the period between each write of the buffered log to the SD card (in seconds)
+log_segment = {}    # the open (today's) segment of each log file, by filename
 
 def strval(array):
     # Change an array into a string (used to save array value into MySQL database or CSV)
     string = " ".join(map(str, array))
     return string
 
+def segment_name(filename,date):
+    # The log is split into one file per day, e.g. modbus_log.csv -> modbus_log-20231015.csv
+    name, ext = os.path.splitext(filename)
+    return "{}-{}{}".format(name, date.strftime("%Y%m%d"), ext)
+
+def list_segments(filename):
+    # Get the (date, path) of the log segments from the oldest to the newest,
+    # an unsegmented log file of the previous version comes first (with an empty date)
+    name, ext = os.path.splitext(filename)
+    segments = []
+    try: files = os.listdir(log_directory)
+    except FileNotFoundError: return segments
+    for f in files:
+        date = f[len(name)+1:len(f)-len(ext)]
+        if f == filename: segments.append(("", os.path.join(log_directory,f)))
+        elif f.startswith(name+"-") and f.endswith(ext) and len(date) == 8 and date.isdigit():
+            segments.append((date, os.path.join(log_directory,f)))
+    return sorted(segments)
+
+def sync_segment(segment):
+    # Write the buffered rows to the SD card
+    segment["file"].flush()
+    os.fsync(segment["file"].fileno())
+    segment["synced"] = time.monotonic()
+
+def close_segment(filename):
+    segment = log_segment.pop(filename, None)
+    if segment:
+        sync_segment(segment)
+        segment["file"].close()
+
+def close_all_segments():
+    for filename in list(log_segment): close_segment(filename)
+atexit.register(close_all_segments)
+
+def expire_segments(filename,timer):
+    # Delete the whole segments that are older than log_limit days
+    limit = timer - datetime.timedelta(days=log_limit)
+    for date, path in list_segments(filename):
+        if date: expired = date < limit.strftime("%Y%m%d")
+        else: expired = datetime.datetime.fromtimestamp(os.path.getmtime(path)) < limit
+        if expired: os.remove(path)
+
 def log_in_csv(title,data,timer,filename):
-    global log_directory, log_limit
+    global log_directory, log_segment, log_sync
     #return
-    file_directory = os.path.join(log_directory,filename)
-    file_exists = True
-    file_empty = True
-    expired_rows_to_delete = None
-    # Check if the file already exist or not
-    try:
-        with open(file_directory, 'r') as file:
-            file_empty = not file.read(1)
-            csv_log = list(csv.reader(file))
-        # Read the line in the CSV file
-        for row, row_data in enumerate(csv_log):
-            if row > 0:
-                csv_date = row_data[0]
-                is_valid_date = True
-                try: datetime.datetime.strptime(csv_date, '%Y-%m-%d %H:%M:%S')
-                except ValueError: is_valid_date = False
-                if is_valid_date:
-                    # Calculate the difference in days
-                    log_date = datetime.datetime.strptime(csv_date, '%Y-%m-%d %H:%M:%S')
-                    # Calculate how long has the data been logged
-                    timediff = (timer - log_date).days
-                    if timediff > log_limit: expired_rows_to_delete.append(row)
-                    else: break
-    except FileNotFoundError: file_exists = False
-    # Remove the expired row then write the updated contents to a new CSV file
-    if expired_rows_to_delete:
-        csv_log = [row_data for row, row_data in enumerate(csv_log) if row not in expired_rows_to_delete]
-        with open(file_directory, 'w') as file:
-            writer = csv.writer(file)
-            writer.writerows(csv_log)
-    # Add new data into csv file ()
-    with open(file_directory, mode='a' if file_exists else 'w', newline='') as file:
-        line = csv.writer(file, delimiter =',')
-        if file_empty: line.writerow(title)
-        data = [strval(d) if isinstance(d,list) else d for d in data]
-        line.writerow(data)
+    segment = log_segment.get(filename)
+    # Open a new segment for the first row of the day (the only time old segments are checked for expiry)
+    if segment is None or segment["date"] != timer.date():
+        close_segment(filename)
+        os.makedirs(log_directory, exist_ok=True)
+        file_directory = os.path.join(log_directory, segment_name(filename, timer))
+        file = open(file_directory, mode='a', newline='')
+        segment = {"date": timer.date(), "file": file,
+                   "line": csv.writer(file, delimiter =','), "synced": time.monotonic()}
+        log_segment[filename] = segment
+        if file.tell() == 0: segment["line"].writerow(title)
+        expire_segments(filename, timer)
+    # Add new data into the open segment, it is written to the SD card every log_sync seconds
+    data = [strval(d) if isinstance(d,list) else d for d in data]
+    segment["line"].writerow(data)
+    if time.monotonic() - segment["synced"] >= log_sync: sync_segment(segment)
 
 #################################################################################################################
 ## Interacting with MySQL Database
 
 def connect_mysql(mysql_server,mysql_query,data=None,timeout=2):
     #return
-    # Set the signal handler for the timeout
-    signal.alarm(timeout)  # Start the timeout countdown
     try:
-        # Setup Raspberry Pi as MySQl Database client
-        with pymysql.connect(host=mysql_server["host"], user=mysql_server["user"], password=mysql_server["password"], db=mysql_server["db"], port=mysql_server["port"]) as db:
+        # Setup Raspberry Pi as MySQl Database client, each socket operation times out after 'timeout' seconds
+        with uploader.open_mysql(mysql_server,timeout) as db:
             # Write data in database
             if data:
                 data = [strval(d) if isinstance(d,list) else d for d in data]
@@ -131,78 +152,215 @@ def connect_mysql(mysql_server,mysql_query,data=None,timeout=2):
                 with db.cursor() as read:
                     read.execute(mysql_query)
                     val = read.fetchall()
-        # Reset the alarm as the query completed successfully
-        signal.alarm(0)
         return val
-    except TimeoutError as e:
-        # Handle the timeout error
+    except Exception as e:
+        # Print the error message (a timeout is a lost connection)
         print("problem with MySQL Server:")
         print(e)
         print("<===== ===== continuing ===== =====>")
         print("")
         return False
+
+#################################################################################################################
+## Durable outbox of the MySQL uploads
+
+outbox_directory = os.path.join(log_directory, 'outbox.db')
+upload_batch = 500  # the maximum number of rows uploaded in a single MySQL command
+upload_interval = 0 # the minimum period between two uploads, unless a full batch is waiting (in seconds)
+mysql_outbox = None
+mysql_uploader = None
+
+def get_outbox():
+    global mysql_outbox
+    if mysql_outbox is None:
+        os.makedirs(log_directory, exist_ok=True)
+        mysql_outbox = outbox.Outbox(outbox_directory, upload_batch)
+    return mysql_outbox
+
+def queue_mysql(mysql_query,data):
+    # Save the data in the outbox, it stays there until it is uploaded by retry_mysql()
+    get_outbox().put(mysql_query, [strval(d) if isinstance(d,list) else d for d in data])
+
+def queue_mysql_many(mysql_query,rows):
+    # Save several rows of data for the same query in the outbox at once (one write to the SD card)
+    get_outbox().put_many(mysql_query, [[strval(d) if isinstance(d,list) else d for d in data] for data in rows])
+
+def retry_mysql(mysql_server,timeout=2):
+    global mysql_uploader
+    #return
+    # Upload the rows in the outbox in batches over one long-lived connection, until the outbox is empty or the upload fails
+    if mysql_uploader is None:
+        mysql_uploader = uploader.Uploader(mysql_server, get_outbox(), upload_batch, upload_interval, timeout)
+    return mysql_uploader.flush()
+
+#################################################################################################################
+## Retention of the MySQL table
+
+retention_batch = 5000  # the maximum number of rows deleted in a single command
+retention_done = None   # date of the last retention run
+
+def delete_db_rows(mysql_server,last_id,timeout=2):
+    # Delete the rows with id < last_id in batches by primary key range, each batch is committed on its own
+    # so the table is never locked for long. Return the number of deleted rows
+    deleted = 0
+    try:
+        with uploader.open_mysql(mysql_server,timeout) as db:
+            with db.cursor() as cursor:
+                cursor.execute("SELECT MIN(id) FROM `{}`".format(mysql_server["table"]))
+                first = cursor.fetchone()[0]
+                while first is not None and first < last_id:
+                    end = min(first + retention_batch, last_id)
+                    deleted += cursor.execute("DELETE FROM `{}` WHERE id >= %s AND id < %s".format(mysql_server["table"]), [first, end])
+                    db.commit()
+                    first = end
     except Exception as e:
         # Print the error message
         print("problem with MySQL Server:")
         print(e)
         print("<===== ===== continuing ===== =====>")
         print("")
-        return False
+    return deleted
 
-def retry_mysql(mysql_server,mysql_query,filename,timeout=2):
-    global log_directory
-    #return
-    file_directory = os.path.join(log_directory,filename)
-    rows_to_delete = []
-    # Check if the file already exist or not
+def limit_db_rows(mysql_server,row_limit,timeout=2):
+    # Keep the newest row_limit rows: the oldest id to keep is found by walking back the primary key index
+    # (no full table scan or sort), the older rows are deleted in batches
+    mysql_query = "SELECT id FROM `{}` ORDER BY id DESC LIMIT 1 OFFSET %s".format(mysql_server["table"])
     try:
-        with open(file_directory, 'r') as file:
-            csv_log = list(csv.reader(file))
-        # Read the line in the CSV file
-        for row, row_data in enumerate(csv_log):
-            if row > 0:
-                # Retry uploading the data to mysql
-                upload_succeed = connect_mysql(mysql_server,mysql_query,row_data,timeout)
-                if upload_succeed: rows_to_delete.append(row)
-                else: break
-    except FileNotFoundError: pass
-    # Write the updated contents to a new CSV file
-    if rows_to_delete:
-        csv_log = [row_data for row, row_data in enumerate(csv_log) if row not in rows_to_delete]
-        with open(file_directory, 'w') as file:
-            writer = csv.writer(file)
-            writer.writerows(csv_log)
+        with uploader.open_mysql(mysql_server,timeout) as db:
+            with db.cursor() as cursor:
+                cursor.execute(mysql_query, [max(row_limit-1, 0)])
+                keep = cursor.fetchone()
+    except Exception as e:
+        # Print the error message
+        print("problem with MySQL Server:")
+        print(e)
+        print("<===== ===== continuing ===== =====>")
+        print("")
+        return 0
+    return delete_db_rows(mysql_server,keep[0],timeout) if keep else 0
 
-def limit_db_rows(mysql_server,row_limit,timeout=2):
-    mysql_query = ("DELETE FROM {} WHERE id NOT IN ( SELECT id FROM ( "
-                       "SELECT id FROM {} ORDER BY id DESC LIMIT %s ) AS limited_rows )".format(
-                           mysql_server["table"],mysql_server["table"]))
-    connect_mysql(mysql_server,mysql_query,[row_limit],timeout)
+def to_days(date):
+    # Same as TO_DAYS() of MySQL
+    return date.toordinal() + 365
+
+def next_period(date,period):
+    # Start of the day/month after the one holding date
+    if period == "month": return (date.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+    return date + datetime.timedelta(days=1)
+
+def is_day_number(bound,today):
+    # True if a partition bound looks like a TO_DAYS() value, between 1970 and 10 years from today
+    return bound.isdigit() and to_days(datetime.date(1970,1,1)) <= int(bound) <= to_days(today) + 3660
+
+def partition_db(mysql_server,keep,column,period="day",ahead=3,timeout=2):
+    # Manage a table partitioned by RANGE (TO_DAYS(<date column>)) into one partition per day/month, named
+    # pYYYYMMDD after their first day, plus a catch-all pmax partition, e.g. created with:
+    #   ALTER TABLE t PARTITION BY RANGE (TO_DAYS(dataentered)) (PARTITION pmax VALUES LESS THAN MAXVALUE)
+    # The partitions of the next 'ahead' periods are added and the partitions that only hold data older than
+    # 'keep' days are dropped, which frees the space at once whatever the table size.
+    # Return None if the table is not partitioned this way (another expression or column, or bounds that are not
+    # day numbers), else the number of dropped partitions
+    table = mysql_server["table"]
+    today = datetime.date.today()
+    with uploader.open_mysql(mysql_server,timeout) as db:
+        with db.cursor() as cursor:
+            cursor.execute("SELECT PARTITION_NAME, PARTITION_DESCRIPTION, PARTITION_EXPRESSION FROM information_schema.PARTITIONS "
+                           "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND PARTITION_METHOD = 'RANGE' "
+                           "ORDER BY PARTITION_ORDINAL_POSITION", [mysql_server["db"], table])
+            partitions = cursor.fetchall()
+            if not partitions or partitions[-1][0] != "pmax": return None
+            # The partitions must be by day numbers of the date column, e.g. a RANGE (id) or RANGE (UNIX_TIMESTAMP(...))
+            # table would have its data partitions dropped
+            expression = "".join((partitions[0][2] or "").split()).replace("`", "").lower()
+            if expression != "to_days({})".format(column.lower()): return None
+            bounds = [(n, str(d)) for n, d, e in partitions if n != "pmax"]
+            if any(not is_day_number(d, today) for n, d in bounds): return None
+            # Add the coming partitions by splitting pmax
+            last = max([int(d) for n, d in bounds] or [0])
+            start, new = today if period == "day" else today.replace(day=1), []
+            for _ in range(ahead + 1):
+                end = next_period(start, period)
+                if to_days(end) > last:
+                    new.append("PARTITION p{} VALUES LESS THAN ({})".format(start.strftime("%Y%m%d"), to_days(end)))
+                start = end
+            if new:
+                cursor.execute("ALTER TABLE `{}` REORGANIZE PARTITION pmax INTO ({}, PARTITION pmax VALUES LESS THAN MAXVALUE)".format(table, ", ".join(new)))
+            # Drop the partitions whose upper bound is before the retention limit
+            limit = to_days(today - datetime.timedelta(days=keep))
+            expired = [n for n, d in bounds if int(d) <= limit]
+            if expired:
+                cursor.execute("ALTER TABLE `{}` DROP PARTITION {}".format(table, ", ".join(expired)))
+    return len(expired)
+
+def retain_db(mysql_server,keep,column,period="day",timeout=2):
+    global retention_done
+    #return
+    # Delete the data older than 'keep' days from the table, at most once a day: whole partitions are dropped when the
+    # table is partitioned (see partition_db), else the old rows are deleted in batches by primary key range
+    if keep <= 0 or retention_done == datetime.date.today(): return
+    try:
+        dropped = partition_db(mysql_server,keep,column,period,timeout=timeout)
+        if dropped is None:
+            # The rows are in id order, the first row to keep is the first one inside the retention period
+            limit = datetime.datetime.now() - datetime.timedelta(days=keep)
+            with uploader.open_mysql(mysql_server,timeout) as db:
+                with db.cursor() as cursor:
+                    cursor.execute("SELECT id FROM `{}` WHERE `{}` >= %s ORDER BY id LIMIT 1".format(mysql_server["table"], column), [limit])
+                    keep_id = cursor.fetchone()
+            if keep_id: delete_db_rows(mysql_server,keep_id[0],timeout)
+        retention_done = datetime.date.today()
+    except Exception as e:
+        # Print the error message
+        print("problem with MySQL Server:")
+        print(e)
+        print("<===== ===== continuing ===== =====>")
+        print("")
 
 #################################################################################################################
-## Calculate uptime and downtime using MySQL
+## Calculate uptime and downtime (kept in a local state file, MySQL is only read once when there is no state file)
 
 bootup_time = datetime.datetime.now()
-def get_updown_time(mysql_server,timer,timeout=2):
-    global bootup_time
+updown_directory = os.path.join(log_directory, 'updown.json')
+updown_state = None
+
+def read_updown_state(mysql_server,timeout=2):
+    # Get the previous [startup, total_uptime, update, total_downtime, downtime] from the state file
+    try:
+        with open(updown_directory, 'r') as file:
+            state = json.load(file)
+        return [datetime.datetime.fromisoformat(state["startup"]), datetime.timedelta(seconds=state["total_uptime"]),
+                datetime.datetime.fromisoformat(state["update"]), datetime.timedelta(seconds=state["total_downtime"]),
+                datetime.timedelta(seconds=state["downtime"])]
+    except (FileNotFoundError, ValueError, KeyError, TypeError): pass
     # Read the previous timestamps from database
     datetime_query = ("SELECT startup_date, startup_time, total_uptime, shutdown_date, shutdown_time, total_downtime, downtime FROM `{}` ORDER BY id DESC LIMIT 1".format(mysql_server["table"]))
     data_datetime = connect_mysql(mysql_server,datetime_query,timeout=timeout)
     if data_datetime:
         # Change the format into suitable timedate objects
         for data in data_datetime:
-            prev_startup = datetime.datetime.combine(data[0], datetime.datetime.min.time()) + data[1]
-            total_uptime = data[2]
-            prev_update = datetime.datetime.combine(data[3], datetime.datetime.min.time()) + data[4]
-            total_downtime = data[5]
-            downtime = data[6]
-    else:
-        # In case of no previous data, initiate the values
-        prev_startup = bootup_time
-        total_uptime = datetime.timedelta(seconds=0)
-        prev_update = timer
-        total_downtime = datetime.timedelta(seconds=0)
-        downtime = datetime.timedelta(seconds=0)
+            return [datetime.datetime.combine(data[0], datetime.datetime.min.time()) + data[1], data[2],
+                    datetime.datetime.combine(data[3], datetime.datetime.min.time()) + data[4], data[5], data[6]]
+    return None
+
+def save_updown_state(state):
+    # Replace the state file atomically (write a new file, then rename it over the old one)
+    os.makedirs(log_directory, exist_ok=True)
+    with open(updown_directory + '.tmp', 'w') as file:
+        json.dump({"startup": state[0].isoformat(), "total_uptime": state[1].total_seconds(),
+                   "update": state[2].isoformat(), "total_downtime": state[3].total_seconds(),
+                   "downtime": state[4].total_seconds()}, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(updown_directory + '.tmp', updown_directory)
+
+def get_updown_time(mysql_server,timer,timeout=2):
+    global bootup_time, updown_state
+    if updown_state is None:
+        updown_state = read_updown_state(mysql_server,timeout)
+        if updown_state is None:
+            # In case of no previous data, initiate the values
+            updown_state = [bootup_time, datetime.timedelta(seconds=0), timer, datetime.timedelta(seconds=0), datetime.timedelta(seconds=0)]
+    prev_startup, total_uptime, prev_update, total_downtime, downtime = updown_state
     # calculate the time difference and culmulative period from the timestamps
     uptime = (timer - bootup_time)
     if abs(bootup_time - prev_startup) < datetime.timedelta(seconds=60):
@@ -210,4 +368,6 @@ def get_updown_time(mysql_server,timer,timeout=2):
     else:
         downtime = abs(bootup_time - prev_update)
         total_downtime = total_downtime + downtime
-    return [bootup_time, uptime, total_uptime, downtime, total_downtime]
\ No newline at end of file
+    updown_state = [bootup_time, total_uptime, timer, total_downtime, downtime]
+    save_updown_state(updown_state)
+    return [bootup_time, uptime, total_uptime, downtime, total_downtime]
@@ -0,0 +1,281 @@
+"""
+#title           :tsdb.py
+#description     :local columnar time-series store of every reading (one compressed series per field)
+#author          :Nicholas Putra Rihandoko
+#date            :2026/10/18
+#version         :0.1
+#usage           :Energy Monitoring System
+#notes           :samples are appended in memory, full chunks (or chunks older than 'age') are compressed and written by
+#                 flush() (upload worker), so a power loss loses at most the last 'age' seconds of each series
+#python_version  :3.7.3
+#==============================================================================
+"""
+
+import os
+import math
+import time
+import mmap
+import struct
+import threading
+import datetime
+from array import array
+
+# Each series (node/field) is kept as one pair of files per month: <directory>/<node>/<field>/<YYYYMM>.dat holds the
+# compressed chunks one after another, <YYYYMM>.idx holds one fixed-size record per chunk (first time, last time,
+# offset, length), so a range query only decodes the chunks that overlap the range, and old months are whole files.
+# In a chunk the timestamps (ms) are delta-of-delta encoded and the values are either delta-of-delta encoded as
+# integers (when every value of the chunk has at most 6 decimals, as the scaled Modbus readings do) or XOR encoded
+# as floats (Gorilla-style, also for the values that are not finite or too large for an exact integer)
+CHUNK = struct.Struct("<qdIBB")     # first time (ms), first value, number of samples, value mode, decimals
+INDEX = struct.Struct("<qqQI4x")    # first time (ms), last time (ms), offset and length of the chunk in the .dat file
+MODE_INT, MODE_XOR = 0, 1
+# Largest scaled integer of MODE_INT: exact as a double, and every delta-of-delta fits the 64-bit bucket
+MAX_INT = 1 << 53
+DOUBLE = struct.Struct("<d")
+QWORD = struct.Struct("<Q")
+# Variable-length buckets of a signed delta-of-delta: (value bits, control code, code bits), then 64 bits
+TIME_BUCKETS = ((7, 0b10, 2), (9, 0b110, 3), (12, 0b1110, 4))
+VALUE_BUCKETS = ((7, 0b10, 2), (12, 0b110, 3), (20, 0b1110, 4))
+
+class BitWriter:
+    def __init__(self):
+        self.acc, self.n = 0, 0
+
+    def write(self,value,bits):
+        self.acc = (self.acc << bits) | value
+        self.n += bits
+
+    def write_signed(self,value,buckets):
+        if value == 0: self.write(0, 1); return
+        for bits, code, length in buckets:
+            if -(1 << (bits-1)) <= value < (1 << (bits-1)):
+                self.write(code, length); self.write(value & ((1 << bits) - 1), bits); return
+        self.write(0b1111, 4); self.write(value & ((1 << 64) - 1), 64)
+
+    def bytes(self):
+        pad = -self.n % 8
+        return (self.acc << pad).to_bytes((self.n + pad) // 8, "big")
+
+class BitReader:
+    def __init__(self,data):
+        self.acc, self.total, self.pos = int.from_bytes(data, "big"), 8*len(data), 0
+
+    def read(self,bits):
+        self.pos += bits
+        return (self.acc >> (self.total - self.pos)) & ((1 << bits) - 1)
+
+    def read_signed(self,buckets):
+        if not self.read(1): return 0
+        bits = 64
+        for b, code, length in buckets:
+            if not self.read(1): bits = b; break
+        value = self.read(bits)
+        return value - (1 << bits) if value >> (bits-1) else value
+
+def decimals(values,limit=6):
+    # The number of decimals every value has at most, None if it is more than limit
+    for d in range(limit + 1):
+        if all(round(v, d) == v for v in values): return d
+    return None
+
+def encode_chunk(times,values):
+    # times: ms (int), values: float, same length (at least 1)
+    bits = BitWriter()
+    delta = 0
+    for k in range(1, len(times)):
+        d = times[k] - times[k-1]
+        bits.write_signed(d - delta, TIME_BUCKETS); delta = d
+    d = decimals(values) if all(math.isfinite(v) for v in values) else None
+    if d is not None:
+        ints = [int(round(v * 10 ** d)) for v in values]
+        if any(not -MAX_INT <= i <= MAX_INT for i in ints): d = None
+    if d is not None:
+        mode = MODE_INT
+        delta = 0
+        for k in range(1, len(ints)):
+            diff = ints[k] - ints[k-1]
+            bits.write_signed(diff - delta, VALUE_BUCKETS); delta = diff
+    else:
+        mode, d = MODE_XOR, 0
+        prev, lead, trail = QWORD.unpack(DOUBLE.pack(values[0]))[0], None, None
+        for v in values[1:]:
+            cur = QWORD.unpack(DOUBLE.pack(v))[0]
+            x = cur ^ prev
+            if x == 0: bits.write(0, 1)
+            else:
+                l, t = min(64 - x.bit_length(), 31), (x & -x).bit_length() - 1
+                if lead is not None and l >= lead and t >= trail:
+                    bits.write(0b10, 2); bits.write(x >> trail, 64 - lead - trail)
+                else:
+                    lead, trail = l, t
+                    bits.write(0b11, 2); bits.write(l, 5); bits.write(63 - l - t, 6); bits.write(x >> t, 64 - l - t)
+            prev = cur
+    return CHUNK.pack(times[0], values[0], len(times), mode, d) + bits.bytes()
+
+def decode_chunk(data):
+    t0, v0, count, mode, d = CHUNK.unpack_from(data)
+    bits = BitReader(bytes(data[CHUNK.size:]))
+    times, delta = [t0], 0
+    for _ in range(count - 1):
+        delta += bits.read_signed(TIME_BUCKETS); times.append(times[-1] + delta)
+    values = [v0]
+    if mode == MODE_INT:
+        scale = 10 ** d
+        last, delta = int(round(v0 * scale)), 0
+        for _ in range(count - 1):
+            delta += bits.read_signed(VALUE_BUCKETS); last += delta
+            values.append(round(last / scale, d))
+    else:
+        prev, lead, trail = QWORD.unpack(DOUBLE.pack(v0))[0], 0, 0
+        for _ in range(count - 1):
+            if bits.read(1):
+                if bits.read(1):
+                    lead = bits.read(5); trail = 64 - lead - (bits.read(6) + 1)
+                prev ^= bits.read(64 - lead - trail) << trail
+            values.append(DOUBLE.unpack(QWORD.pack(prev))[0])
+    return times, values
+
+def field_name(node,name,*index):
+    # Field behind an item of a "compile" parameter, e.g. field_name(battery, "Cell_Voltage_M3", 7) for cell 7 of
+    # module 3 (the index counts from 1, as printed by query.print_response)
+    item = node._extra_calc[name]["compile"]
+    for i in index: item = item[i-1]
+    return item
+
+class TimeSeriesStore:
+    def __init__(self,directory,chunk=720,keep=0,age=900):
+        self._directory = directory
+        self.chunk = chunk      # the number of samples in a full chunk
+        self.age = age          # the maximum age (in seconds) of the first sample of a chunk before it is written, 0 for none
+        self.keep = keep        # the number of months kept (besides the current one), 0 to keep everything
+        self._open = {}         # series: [month, times (ms), values] of the chunk being filled
+        self._full = []         # [series, month, times, values] waiting to be written
+        self._last = {}         # series: time (ms) of the last sample, to skip fields that were not read again
+        self._expired = None    # the oldest month kept after the last expire()
+        self._lock = threading.Lock()           # append() and the readers against flush()
+        self._write_lock = threading.Lock()     # a single writer
+
+    def path(self,series,month):
+        return os.path.join(self._directory, series, month)
+
+    def append(self,series,timestamp,value):
+        # Add one sample (time in epoch seconds) to the series, in memory
+        t = int(round(timestamp * 1000))
+        month = datetime.datetime.fromtimestamp(timestamp).strftime("%Y%m")
+        with self._lock:
+            if t <= self._last.get(series, -1): return
+            self._last[series] = t
+            buffer = self._open.get(series)
+            if buffer is not None and buffer[0] != month:
+                self._full.append([series] + buffer); buffer = None
+            if buffer is None: buffer = self._open[series] = [month, array("q"), array("d")]
+            buffer[1].append(t); buffer[2].append(value)
+            if len(buffer[1]) >= self.chunk:
+                self._full.append([series] + buffer); del self._open[series]
+
+    def append_nodes(self,server,snapshots):
+        # Add every valid field of the snapshot of each node (as returned by BusPoller.read) as <node name>/<field>
+        for node, snapshot in zip(server, snapshots):
+            for name, value, timestamp in snapshot.fields():
+                self.append(node._name + "/" + name, timestamp, value)
+
+    def flush(self,force=False):
+        # Compress and write the full chunks and the chunks older than 'age', and every chunk being filled when
+        # force is True
+        limit = int((time.time() - self.age) * 1000) if self.age else None
+        with self._write_lock:
+            with self._lock:
+                full, self._full = self._full, []
+                for series, buffer in list(self._open.items()):
+                    if force or (limit is not None and buffer[1][0] <= limit):
+                        full.append([series] + buffer); del self._open[series]
+            for series, month, times, values in full:
+                data = encode_chunk(times, values)
+                path = self.path(series, month)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                self.repair(path)
+                # The chunk is written before its index record, so the index never points past the data
+                with open(path + ".dat", "ab") as file:
+                    offset = file.tell()
+                    file.write(data); file.flush(); os.fsync(file.fileno())
+                with open(path + ".idx", "ab") as file:
+                    file.write(INDEX.pack(times[0], times[-1], offset, len(data))); file.flush(); os.fsync(file.fileno())
+            return len(full)
+
+    def repair(self,path):
+        # Cut what a power loss may have left at the end of the index: a torn record (the next records would be
+        # written at a misaligned offset) and the records of chunks that are not entirely in the .dat file
+        try: size = os.path.getsize(path + ".idx")
+        except FileNotFoundError: return
+        try: data = os.path.getsize(path + ".dat")
+        except FileNotFoundError: data = 0
+        n = size // INDEX.size
+        with open(path + ".idx", "r+b") as file:
+            while n > 0:
+                file.seek((n-1) * INDEX.size)
+                first, last, offset, length = INDEX.unpack(file.read(INDEX.size))
+                if offset + length <= data: break
+                n -= 1
+            if n * INDEX.size != size:
+                print(" -- {}.idx is cut from {} to {} bytes --".format(path, size, n * INDEX.size))
+                file.truncate(n * INDEX.size); file.flush(); os.fsync(file.fileno())
+
+    def months(self,series):
+        try: return sorted(f[:-4] for f in os.listdir(os.path.join(self._directory, series)) if f.endswith(".idx"))
+        except FileNotFoundError: return []
+
+    def read_month(self,series,month,start,end):
+        # Decode the chunks of one month file that overlap [start, end] (ms), found by binary search in the index
+        times, values = [], []
+        path = self.path(series, month)
+        with open(path + ".idx", "rb") as idx, open(path + ".dat", "rb") as dat:
+            n = os.fstat(idx.fileno()).st_size // INDEX.size
+            if n == 0 or os.fstat(dat.fileno()).st_size == 0: return times, values
+            with mmap.mmap(idx.fileno(), 0, access=mmap.ACCESS_READ) as index, mmap.mmap(dat.fileno(), 0, access=mmap.ACCESS_READ) as chunks:
+                # First chunk whose last time is not before start
+                lo, hi = 0, n
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    if INDEX.unpack_from(index, mid*INDEX.size)[1] < start: lo = mid + 1
+                    else: hi = mid
+                for i in range(lo, n):
+                    first, last, offset, length = INDEX.unpack_from(index, i*INDEX.size)
+                    # A record past the end of the data (power loss) is cut by the next repair()
+                    if first > end or offset + length > len(chunks): break
+                    t, v = decode_chunk(chunks[offset:offset+length])
+                    for k in range(len(t)):
+                        if start <= t[k] <= end: times.append(t[k]); values.append(v[k])
+        return times, values
+
+    def range(self,series,start,end):
+        # Get the (times, values) of a series between start and end (epoch seconds), e.g.
+        # store.range("BATTERY/" + field_name(battery, "Cell_Voltage_M3", 7), now - 86400, now)
+        t0, t1 = int(start * 1000), int(end * 1000)
+        first = datetime.datetime.fromtimestamp(start).strftime("%Y%m")
+        last = datetime.datetime.fromtimestamp(end).strftime("%Y%m")
+        times, values = [], []
+        for month in self.months(series):
+            if first <= month <= last:
+                t, v = self.read_month(series, month, t0, t1)
+                times.extend(t); values.extend(v)
+        # Samples that are not written yet
+        with self._lock:
+            pending = [b[1:] for b in self._full if b[0] == series] + ([self._open[series][1:]] if series in self._open else [])
+            for t, v in pending:
+                for k in range(len(t)):
+                    if t0 <= t[k] <= t1 and (not times or t[k] > times[-1]): times.append(t[k]); values.append(v[k])
+        return [t / 1000 for t in times], values
+
+    def expire(self,timer):
+        # Delete the month files older than keep months
+        if not self.keep: return
+        month = timer.year * 12 + timer.month - 1 - self.keep
+        limit = "{:04d}{:02d}".format(month // 12, month % 12 + 1)
+        if limit == self._expired: return
+        self._expired = limit
+        for root, dirs, files in os.walk(self._directory):
+            for f in files:
+                if f[:6] < limit and f[6:] in (".dat", ".idx"): os.remove(os.path.join(root, f))
+
+    def close(self):
+        self.flush(force=True)
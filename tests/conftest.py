@@ -0,0 +1,18 @@
+"""
+#title           :conftest.py
+#description     :paths of the modules under test (node engine, device libraries, simulator, example project code)
+#author          :Nicholas Putra Rihandoko
+#date            :2026/10/18
+#version         :0.1
+#usage           :python3 -m pytest tests
+#notes           :
+#python_version  :3.7.3
+#==============================================================================
+"""
+
+import os
+import sys
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in ["MODBUS_NODE/code", "TRISTAR_MPTT/code", "KYUDEN_BATTERY_72kWh/code", "YASKAWA_GA500/code", "MODBUS_SIMULATOR/code", "_example_projects/ems/modbus_code"]:
+    sys.path.insert(0, os.path.join(root, path))
@@ -0,0 +1,125 @@
+"""
+#title           :test_decoder.py
+#description     :tests of the block decoder and the measurement store of the node engine
+#author          :Nicholas Putra Rihandoko
+#date            :2026/10/18
+#version         :0.1
+#usage           :python3 -m pytest tests
+#notes           :the decoded values are checked against hand-computed payloads and the handle_sign/save_read
+#                 decoding of the device libraries before the engine was shared
+#python_version  :3.7.3
+#==============================================================================
+"""
+
+import random
+import pytest
+import modbus_node
+
+def handle_sign(register,inc):
+    # 2's complement conversion of the device libraries before BlockDecoder (one value per 'inc' registers)
+    signed_values = []
+    for i, data in enumerate(register):
+        if i % inc == 0:
+            for b in range(inc-1,0,-1):
+                data = (data << 16) | register[i+b]
+            if data >= (0x8000 << (16*(inc-1))):
+                signed_value = -int((data ^ ((1 << (16*inc)) - 1)) + 1)
+            else: signed_value = int(data)
+            signed_values.append(signed_value)
+        else: signed_values.append(None)
+    return signed_values
+
+def decoder(count,inc,fields):
+    # fields: (offset, name, scale, bias, round[, signed])
+    return modbus_node.BlockDecoder(count, inc, [f if len(f) == 6 else f + (True,) for f in fields])
+
+def test_signed_16_bit():
+    block = decoder(4, 1, [(0, "A", 1, 0, 0), (1, "B", 0.1, 0, 1), (2, "C", 1, 0, 0, False), (3, "D", 1, -40, 0)])
+    assert block.decode([0xFFFE, 0x8000, 0xFFFE, 0x0041]) == [-2, -3276.8, 65534, 25]
+
+def test_signed_32_bit():
+    block = decoder(6, 2, [(0, "A", 1, 0, 0), (2, "B", 0.01, 0, 2), (4, "C", 1, 0, 0, False)])
+    assert block.decode([0xFFFF, 0xFFFE, 0x0001, 0x0000, 0xFFFF, 0xFFFF]) == [-2, 655.36, 4294967295]
+
+def test_gaps_and_unaligned_fields():
+    # Registers 1..2 are a gap, offset 3 is not aligned with the 32-bit increment (None)
+    block = decoder(8, 2, [(0, "A", 1, 0, 0), (3, "B", 1, 0, 0), (4, "C", 1, 0, 0)])
+    assert block.decode([0, 7, 0xAAAA, 0xBBBB, 0, 0, 0xFFFF, 0xFFFF]) == [7, None, 0]
+    block = decoder(5, 1, [(0, "A", 1, 0, 0), (4, "B", 1, 0, 0)])
+    assert block.decode([1, 2, 3, 4, 5]) == [1, 5]
+
+def test_signedness_of_a_shared_offset_follows_the_first_field():
+    # Two fields of the same register: the first one (unsigned) sets how the register is decoded
+    block = decoder(1, 1, [(0, "A", 1, 0, 0, False), (0, "B", 0.5, 0, 1, True)])
+    assert block.decode([0xFFFE]) == [65534, 32767.0]
+    block = decoder(1, 1, [(0, "A", 1, 0, 0, True), (0, "B", 0.5, 0, 1, False)])
+    assert block.decode([0xFFFE]) == [-2, -1.0]
+
+@pytest.mark.parametrize("inc", [1, 2])
+def test_parity_with_handle_sign(inc):
+    rng = random.Random(inc)
+    for _ in range(200):
+        count = inc * rng.randint(1, 20)
+        offsets = sorted(rng.sample(range(0, count, inc), rng.randint(1, count // inc)))
+        fields = [(o, "F{}".format(o), rng.choice([1, 0.1, 0.01, 1/(2**16)]), rng.choice([0, -40, 0.5]), rng.choice([0, 1, 2, 5])) for o in offsets]
+        registers = [rng.randrange(0x10000) for _ in range(count)]
+        signed = handle_sign(registers, inc)
+        expected = [round(signed[o] * scale + bias, rnd) for o, name, scale, bias, rnd in fields]
+        assert decoder(count, inc, fields).decode(registers) == expected
+
+def store():
+    return modbus_node.MeasurementStore(["A", "B", "C"], {"ALL": ["A", ["B", "C"]]})
+
+def test_store_validity_bitmap():
+    s = store()
+    with pytest.raises(AttributeError): s.get("A")
+    assert s.get("ALL") == [None, [None, None]] and s.items() == []
+    s.set_many((0, 1, 2), (1, 2.5, 3), 100.0)
+    assert s.get("A") == 1 and isinstance(s.get("A"), int) and s.get("B") == 2.5
+    assert s.get("ALL") == [1, [2.5, 3]] and s.timestamp("B") == 100.0
+    # A value that can not be decoded (None) invalidates the field
+    s.set_many((1,), (None,), 200.0)
+    with pytest.raises(AttributeError): s.get("B")
+    assert s.timestamp("B") is None and s.get("ALL") == [1, [None, 3]]
+    assert [f[0] for f in s.fields()] == ["A", "C"]
+
+class Pair(modbus_node.Node):
+    # Two 16-bit fields read in two blocks (max_count=1)
+    memory_dict = {"A": {"fc":0x03, "address":0x0000, "scale":1, "bias":0, "round":0},
+                   "B": {"fc":0x03, "address":0x0001, "scale":1, "bias":0, "round":0}}
+
+class Response:
+    def __init__(self,registers):
+        self.registers = registers
+
+    def isError(self):
+        return False
+
+class Client:
+    # Answers with the register address + value, raises once the read number 'fail' is reached
+    def __init__(self,value,fail=None):
+        self.value, self.fail, self.reads = value, fail, 0
+
+    def read_holding_registers(self,address,count,unit=None):
+        self.reads += 1
+        if self.reads == self.fail: raise IOError("no response")
+        return Response([address + self.value])
+
+def test_failed_read_keeps_the_last_values():
+    node = Pair(unit=1, name="PAIR", client=Client(10), max_count=1, delay=0)
+    node.send_command("read", ["A", "B"])
+    assert (node.A, node.B) == (10, 11)
+    stamp = node._store.timestamp("B")
+    # The second block fails: the first block is saved, the second field keeps its last value and time
+    node._client = Client(20, fail=2)
+    with pytest.raises(IOError): node.send_command("read", ["A", "B"])
+    assert (node.A, node.B) == (20, 11) and node._store.timestamp("B") == stamp
+
+def test_store_reset_forgets_the_readings():
+    s = store()
+    s.set_many((0, 1), (1.5, 2), 100.0)
+    s.reset()
+    with pytest.raises(AttributeError): s.get("A")
+    assert s.items() == [] and list(s.fields()) == [] and s.timestamp("A") is None
+    s.set_many((0,), (4.5,), 300.0)
+    assert s.get("A") == 4.5 and isinstance(s.get("A"), float)
@@ -0,0 +1,184 @@
+"""
+#title           :test_modbus_node.py
+#description     :regression tests of the node engine (calculated parameters after a partial read)
+#author          :Nicholas Putra Rihandoko
+#date            :2026/10/18
+#version         :0.1
+#usage           :python3 -m pytest tests
+#notes           :
+#python_version  :3.7.3
+#==============================================================================
+"""
+
+import asyncio
+import modbus_node
+import tristar_MPPT
+import kyuden_battery_72kWh
+import yaskawa_GA500
+
+class Response:
+    def __init__(self,registers):
+        self.registers = registers
+
+    def isError(self):
+        return False
+
+class Client:
+    # Answers every read with the registers of a {address: value} image (0 elsewhere)
+    def __init__(self,image):
+        self.image = image
+        self.reads = []
+
+    def read_holding_registers(self,address,count,unit=None):
+        self.reads.append((address, count))
+        return Response([self.image.get(address+i, 0) for i in range(count)])
+
+def tristar():
+    # V_PU = 80 + 0.25, I_PU = 60, Battery_Voltage = Array_Voltage = 0x2000 (80.25*0x2000/2**15 = 20.06 V)
+    client = Client({0x0000: 80, 0x0001: 0x4000, 0x0002: 60, 0x0003: 0, 0x0018: 0x2000, 0x001B: 0x2000, 0x0023: 25})
+    return tristar_MPPT.node(unit=1, name="TriStar", client=client, delay=0), client
+
+def test_partial_read_keeps_calculated_fields():
+    node, client = tristar()
+    node.send_command("read", ["V_PU", "Battery_Voltage", "Heatsink_Temperature"])
+    assert node.V_PU == 80.25 and node.Battery_Voltage == 20.06
+    stamp = node._store.timestamp("Battery_Voltage")
+    # Only the heatsink temperature is due: the battery voltage is neither scaled again nor refreshed
+    for _ in range(3):
+        node.send_command("read", ["Heatsink_Temperature"])
+        assert node.Battery_Voltage == 20.06
+        assert node._store.timestamp("Battery_Voltage") == stamp
+    assert node.Heatsink_Temperature == 25
+
+def test_self_referencing_field_is_calculated_from_its_register():
+    node, client = tristar()
+    # The field is read on every poll (with the V_PU registers): it is always calculated from its register value
+    for _ in range(3):
+        node.send_command("read", ["Array_Voltage"])
+        assert node.Array_Voltage == 20.06
+    assert node.get_read_plan(None, node.normalize_address(["Array_Voltage"])).extras == ("V_PU", "Array_Voltage")
+
+def test_calculated_field_needs_every_dependency_in_the_plan():
+    node = yaskawa_GA500.node(unit=1, name="GA500", client=None)
+    plan = node.get_read_plan(None, node.normalize_address(["AC_Power"]))
+    assert plan.extras == ("AC_Power",)
+    plan = node.get_read_plan(None, node.normalize_address(["DC_Current"]))
+    assert "DC_Current_raw" in plan.extras and "DC_Current" in plan.extras
+
+def test_transaction_time_follows_the_learned_margin():
+    node = yaskawa_GA500.node(unit=1, name="GA500", client=None, delay=200, baudrate=9600)
+    start = node.transaction_time(10)
+    node._pacer.end(True)
+    assert node._pacer.margin < 0.2
+    assert abs((start - node.transaction_time(10)) - (0.2 - node._pacer.margin)) < 1e-9
+
+def test_pacer_margin_grows_after_a_failure_and_shrinks_after_an_answer():
+    pacer = modbus_node.FramePacer(object(), 9600, margin=0.01)
+    pacer.begin(); pacer.end(False)
+    assert pacer.margin == 0.02 + pacer.silent and pacer.failures == 1 and pacer.errors == 1
+    pacer.begin(); pacer.end(True)
+    assert pacer.margin == (0.02 + pacer.silent) * pacer.shrink and pacer.failures == 0
+    # The next command waits for the silent interval plus the margin of the slave
+    assert pacer.silent < pacer.wait_time() <= pacer.silent + pacer.margin
+    for _ in range(20): pacer.end(False)
+    assert pacer.margin == pacer.max_margin
+
+def test_pacer_settles_above_a_fixed_turnaround():
+    # A slave that answers when the margin is at least its turnaround, polled for a long run
+    pacer = modbus_node.FramePacer(object(), 9600, margin=0.2)
+    turnaround, failures = 0.031, []
+    for k in range(5000):
+        answered = pacer.margin >= turnaround
+        pacer.end(answered)
+        if not answered: failures.append(k)
+    # Only the first decay finds the turnaround, there are no periodic failures afterwards
+    assert len(failures) == 1
+    assert turnaround <= pacer.margin == pacer.floor < turnaround / pacer.shrink
+    # Noise at the floor does not move it
+    pacer.end(False)
+    for _ in range(200): pacer.end(True)
+    assert pacer.margin == pacer.floor < turnaround / pacer.shrink
+
+def test_pacer_fixed_margin_and_shared_bus():
+    bus = object()
+    first, second = modbus_node.FramePacer(bus, 9600, 0.05, adaptive=False), modbus_node.FramePacer(bus, 9600, 0.05, adaptive=False)
+    first.begin(); first.end(False)
+    assert first.margin == 0.05
+    # Another slave of the bus only waits for the silent interval after the last frame of the bus
+    assert 0 < second.wait_time() <= second.silent
+    assert modbus_node.FramePacer(object(), 115200).silent == 0.00175
+
+class AsyncClient:
+    # asyncio client of pymodbus 2.x (unit=...) over a {address: value} image
+    def __init__(self,image):
+        self.image = image
+        self.units = []
+
+    async def read_holding_registers(self,address,count=1,**kwargs):
+        self.units.append(kwargs["unit"])
+        return Response([self.image.get(address+i, 0) for i in range(count)])
+
+class AsyncClient3(AsyncClient):
+    # asyncio client of pymodbus 3.x, the slave id is the 'slave' keyword
+    async def read_holding_registers(self,address,count=1,slave=0,**kwargs):
+        if kwargs: raise TypeError("unexpected keyword {}".format(list(kwargs)))
+        self.units.append(slave)
+        return Response([self.image.get(address+i, 0) for i in range(count)])
+
+def run_async_node(client):
+    node = tristar_MPPT.async_node(unit=7, name="TriStar", client=client, delay=0)
+    async def poll():
+        await node.send_command("read", ["V_PU", "Battery_Voltage"])
+        await node.send_command("read", ["Heatsink_Temperature"])
+    asyncio.run(poll())
+    return node
+
+def test_async_node_reads_like_the_sync_node():
+    image = {0x0000: 80, 0x0001: 0x4000, 0x0018: 0x2000, 0x0023: 25}
+    sync, client = tristar()
+    sync.send_command("read", ["V_PU", "Battery_Voltage"])
+    for client in (AsyncClient(image), AsyncClient3(image)):
+        node = run_async_node(client)
+        assert node.Battery_Voltage == sync.Battery_Voltage == 20.06 and node.Heatsink_Temperature == 25
+        # Every command is addressed to the slave, never to 0 (broadcast)
+        assert client.units and set(client.units) == {7}
+
+class Map(modbus_node.Node):
+    # Register map of 40 consecutive 16-bit fields R0..R39 at address 0..39
+    memory_dict = {"R{}".format(a): {"fc":0x03, "address":a, "scale":1, "bias":0, "round":0} for a in range(40)}
+
+def test_plan_blocks_splits_at_max_count():
+    node = Map(unit=1, name="MAP", client=None, max_count=20)
+    blocks = node.plan_blocks(list(range(30)))
+    assert len(blocks) == 2 and blocks[0][0] == 0 and blocks[-1][1] == 29
+    assert all(last - first + 1 <= 20 for first, last in blocks)
+    assert all(a[1] + 1 == b[0] for a, b in zip(blocks, blocks[1:]))
+
+def test_plan_blocks_bridges_a_cheap_gap_only():
+    node = Map(unit=1, name="MAP", client=None, max_count=125, baudrate=9600)
+    # A gap of a few registers costs less than another command
+    assert node.plan_blocks([0, 1, 6, 7]) == [[0, 7]]
+    # Reading 30 unused registers costs more than a command (10 ms overhead + 200 ms delay)
+    node = Map(unit=1, name="MAP", client=None, max_count=125, baudrate=9600, delay=0, overhead=0)
+    assert node.plan_blocks([0, 1, 32, 33]) == [[0, 1], [32, 33]]
+
+def test_plan_blocks_never_bridges_a_forbidden_gap():
+    node = Map(unit=1, name="MAP", client=None, max_count=125, forbidden=[[3, 4]])
+    assert node.plan_blocks([0, 1, 6, 7]) == [[0, 1], [6, 7]]
+    # A read address next to the range is still read, only the gap is refused
+    assert node.plan_blocks([0, 2, 5]) == [[0, 2], [5, 5]]
+    assert not node.can_read_block(2, 5) and node.can_read_block(5, 7)
+    # The forbidden ranges are shifted like the register map
+    node = Map(unit=1, name="MAP", client=None, max_count=125, shift=100, forbidden=[[3, 4]])
+    assert node.plan_blocks([100, 101, 106, 107]) == [[100, 101], [106, 107]]
+
+def test_plan_frame_count_of_the_kyuden_battery():
+    # Every cell voltage and temperature of the 16 modules, SOC and total voltage (as the kyuden_soc project reads)
+    address = ["Cell_Voltage_M{}".format(m) for m in range(1, 17)] + ["Module_Temperature", "SOC", "Total_Voltage"]
+    for max_count, frames in ((20, 14), (125, 4)):
+        node = kyuden_battery_72kWh.node(unit=1, name="BATTERY", client=None, max_count=max_count, baudrate=9600)
+        plan = node.get_read_plan(None, node.normalize_address(address))
+        assert len(plan.blocks) == frames
+        assert all(fc == 0x04 and count <= max_count for fc, start, count, decoder in plan.blocks)
+        names = set(name for fc, start, count, decoder in plan.blocks for name in decoder.names)
+        assert {"Voltage_M1_C1", "Voltage_M16_C12", "Temperature_M16_1", "SOC", "Total_Voltage"} <= names
@@ -0,0 +1,124 @@
+"""
+#title           :test_poller.py
+#description     :tests of the deadline-aware poll scheduler and of the read plan cache of the nodes
+#author          :Nicholas Putra Rihandoko
+#date            :2026/10/18
+#version         :0.1
+#usage           :python3 -m pytest tests
+#notes           :the scheduler clock (time.monotonic) is replaced by a clock set by the tests
+#python_version  :3.7.3
+#==============================================================================
+"""
+
+import pytest
+import modbus_node
+import poller
+
+class Mixed(modbus_node.Node):
+    # 16-bit fields R0..R3 (fc 0x03) at address 0..3 and I0..I3 (fc 0x04) at address 0x100..0x103
+    memory_dict = dict({"R{}".format(a): {"fc":0x03, "address":a, "scale":1, "bias":0, "round":0} for a in range(4)},
+                       **{"I{}".format(a): {"fc":0x04, "address":0x100+a, "scale":1, "bias":0, "round":0} for a in range(4)})
+
+class Response:
+    def __init__(self,registers):
+        self.registers = registers
+
+    def isError(self):
+        return False
+
+class Client:
+    # Answers every read with zeros and records (fc, address, count)
+    def __init__(self):
+        self.reads = []
+
+    def read_holding_registers(self,address,count,unit=None):
+        self.reads.append((0x03, address, count))
+        return Response([0]*count)
+
+    def read_input_registers(self,address,count,unit=None):
+        self.reads.append((0x04, address, count))
+        return Response([0]*count)
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(poller.time, "monotonic", clock)
+    return clock
+
+def scheduler(addr,rate=None,default=(10,1)):
+    client = Client()
+    node = Mixed(unit=1, name="MIXED", client=client, delay=0)
+    return poller.PollScheduler(poller.BusPoller([node]), [addr], rate=rate and [rate], default=default), node, client
+
+def test_single_function_code_per_cycle(clock):
+    sched, node, client = scheduler(["R0", "I0", "R1", "I1"])
+    # Everything is due at start-up: the 0x03 items are read first, the 0x04 items wait for the next cycle
+    sched.read()
+    assert {r[0] for r in client.reads} == {0x03}
+    assert sched.wait_time() == 0
+    client.reads = []
+    sched.read()
+    assert {r[0] for r in client.reads} == {0x04}
+    assert sched.wait_time() == 9
+
+def test_jitter_and_missed_deadlines(clock):
+    sched, node, client = scheduler(["R0"], default=(10,1))
+    sched.read()
+    assert sched.missed == [] and sched._item[0][0]["deadline"] == 10
+    # Not due before deadline - jitter
+    clock.now = 8.5
+    assert sched.wait_time() == 0.5
+    # Read early within the jitter: on time, the phase is kept
+    clock.now = 9.0
+    sched.read()
+    assert sched.missed == [] and sched._item[0][0]["deadline"] == 20
+    # Read late within the jitter: on time
+    clock.now = 20.5
+    sched.read()
+    assert sched.missed == [] and sched._item[0][0]["deadline"] == 30
+    # Beyond the jitter: a missed deadline, the phase is kept while the next deadline is still ahead
+    clock.now = 35.0
+    sched.read()
+    assert sched.missed == [("MIXED", "R0", 5.0)] and sched.missed_count == {("MIXED", "R0"): 1}
+    assert sched._item[0][0]["deadline"] == 40
+    # More than a whole period late: the period restarts
+    clock.now = 55.0
+    sched.read()
+    assert sched.missed_count == {("MIXED", "R0"): 2} and sched._item[0][0]["deadline"] == 65
+
+def test_failing_node_stays_due(clock):
+    sched, node, client = scheduler(["R0"])
+    def fail(address,count,unit=None): raise IOError("no response")
+    client.read_holding_registers = fail
+    sched.read()
+    assert "MIXED" in sched._bus.error and sched._item[0][0]["deadline"] == 0 and sched.missed == []
+
+def test_read_plans_are_shared_by_the_same_set_of_items(clock):
+    # R3 is due every second, R0 is packed along as a neighbour once half of its period has passed
+    sched, node, client = scheduler(["R0", "R3"], rate={"R0": [10, 0], "R3": [1, 0]})
+    for t in range(30):
+        clock.now = float(t)
+        sched.read()
+    # The same set of items is the same read request, whichever item is due (a single cached read plan)
+    assert {key[1] for key in node._read_plan if len(key[1]) > 1} == {("r0", "r3")}
+
+def test_read_plan_cache_is_bounded():
+    node = Mixed(unit=1, name="MIXED", client=Client(), delay=0)
+    node.max_plans = 4
+    requests = [["r{}".format(a) for a in range(4) if mask >> a & 1] for mask in range(1, 16)]
+    for address in requests: node.send_command("read", address)
+    assert len(node._read_plan) == 4
+    # The last plans are kept, a cached plan is used again
+    plan = node.get_read_plan(None, node.normalize_address(requests[-1]))
+    assert node.get_read_plan(None, node.normalize_address(requests[-1])) is plan
+    # A used plan is kept over the older ones
+    node.get_read_plan(None, node.normalize_address(requests[-4]))
+    node.send_command("read", requests[0])
+    assert (None, tuple(requests[-4])) in node._read_plan and (None, tuple(requests[-3])) not in node._read_plan
@@ -0,0 +1,113 @@
+"""
+#title           :test_query.py
+#description     :tests of the MySQL retention by partition and of the daily CSV log segments
+#author          :Nicholas Putra Rihandoko
+#date            :2026/10/18
+#version         :0.1
+#usage           :python3 -m pytest tests
+#notes           :the MySQL connection is replaced by a fake one, the CSV log is written in a temporary directory
+#python_version  :3.7.3
+#==============================================================================
+"""
+
+import datetime
+import pytest
+
+pytest.importorskip("pymysql")
+import query
+
+class Cursor:
+    def __init__(self,db):
+        self.db = db
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        return False
+
+    def execute(self,sql,args=None):
+        self.db.executed.append(sql)
+
+    def fetchall(self):
+        return self.db.partitions
+
+class Connection:
+    def __init__(self,partitions):
+        self.partitions = partitions
+        self.executed = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        return False
+
+    def cursor(self):
+        return Cursor(self)
+
+SERVER = {"db": "db", "table": "data"}
+
+def partitioned(monkeypatch,expression,bounds):
+    db = Connection([("p{}".format(i), d, expression) for i, d in enumerate(bounds)] + [("pmax", "MAXVALUE", expression)])
+    monkeypatch.setattr(query.uploader, "open_mysql", lambda server, timeout: db)
+    return db
+
+def day(days):
+    return str(query.to_days(datetime.date.today() + datetime.timedelta(days=days)))
+
+def test_partitions_by_day_are_dropped_and_added(monkeypatch):
+    db = partitioned(monkeypatch, "to_days(`DateTime`)", [day(-40), day(-39), day(-1), day(0), day(1)])
+    assert query.partition_db(SERVER, 30, "DateTime") == 2
+    assert any("REORGANIZE PARTITION pmax" in sql for sql in db.executed)
+    assert any(sql.endswith("DROP PARTITION p0, p1") for sql in db.executed)
+
+@pytest.mark.parametrize("expression", ["`id`", "unix_timestamp(`DateTime`)", "to_days(`other_date`)", None])
+def test_other_partition_expression_is_left_alone(monkeypatch,expression):
+    db = partitioned(monkeypatch, expression, [day(-40), day(-1)])
+    assert query.partition_db(SERVER, 30, "DateTime") is None
+    assert not any(sql.startswith("ALTER") for sql in db.executed)
+
+def test_bounds_that_are_not_day_numbers_are_left_alone(monkeypatch):
+    db = partitioned(monkeypatch, "to_days(`DateTime`)", ["1000", "2000"])
+    assert query.partition_db(SERVER, 30, "DateTime") is None
+    assert not any(sql.startswith("ALTER") for sql in db.executed)
+
+@pytest.fixture
+def log(monkeypatch,tmp_path):
+    monkeypatch.setattr(query, "log_directory", str(tmp_path))
+    monkeypatch.setattr(query, "log_segment", {})
+    yield tmp_path
+    query.close_all_segments()
+
+def rows(path):
+    with open(path) as f: return f.read().splitlines()
+
+def test_log_segments_rotate_by_day(log):
+    title = ["time", "Voltage"]
+    query.log_in_csv(title, ["2026-10-17 23:59:00", 230.1], datetime.datetime(2026,10,17,23,59), "modbus_log.csv")
+    query.log_in_csv(title, ["2026-10-18 00:00:00", [1, 2]], datetime.datetime(2026,10,18,0,0), "modbus_log.csv")
+    query.log_in_csv(title, ["2026-10-18 00:01:00", 230.3], datetime.datetime(2026,10,18,0,1), "modbus_log.csv")
+    query.close_all_segments()
+    assert sorted(p.name for p in log.iterdir()) == ["modbus_log-20261017.csv", "modbus_log-20261018.csv"]
+    assert rows(log / "modbus_log-20261017.csv") == ["time,Voltage", "2026-10-17 23:59:00,230.1"]
+    # The header is written once per segment
+    assert rows(log / "modbus_log-20261018.csv") == ["time,Voltage", "2026-10-18 00:00:00,1 2", "2026-10-18 00:01:00,230.3"]
+
+def test_restart_in_the_middle_of_a_segment_appends_without_header(log):
+    title = ["time", "Voltage"]
+    query.log_in_csv(title, ["12:00", 230.1], datetime.datetime(2026,10,18,12,0), "modbus_log.csv")
+    # Restart of the program: the open segments are closed and forgotten
+    query.close_all_segments()
+    assert query.log_segment == {}
+    query.log_in_csv(title, ["12:01", 230.2], datetime.datetime(2026,10,18,12,1), "modbus_log.csv")
+    query.close_all_segments()
+    assert rows(log / "modbus_log-20261018.csv") == ["time,Voltage", "12:00,230.1", "12:01,230.2"]
+
+def test_old_segments_expire_when_a_new_one_is_opened(log):
+    old = log / "modbus_log-20260901.csv"
+    kept = log / "modbus_log-20261001.csv"
+    other = log / "other_log-20260901.csv"
+    for path in (old, kept, other): path.write_text("time\n")
+    query.log_in_csv(["time"], ["12:00"], datetime.datetime(2026,10,18,12,0), "modbus_log.csv")
+    assert not old.exists() and kept.exists() and other.exists()
@@ -0,0 +1,47 @@
+"""
+#title           :test_simulator.py
+#description     :regression tests of the Modbus slave simulator (broadcast frames)
+#author          :Nicholas Putra Rihandoko
+#date            :2026/10/18
+#version         :0.1
+#usage           :python3 -m pytest tests
+#notes           :
+#python_version  :3.7.3
+#==============================================================================
+"""
+
+import struct
+import modbus_simulator
+
+def frame(unit,pdu):
+    data = bytes([unit]) + pdu
+    return data + struct.pack("<H", modbus_simulator.crc16(data))
+
+def simulator():
+    library = modbus_simulator.load_device("omron_KMN1FLK")
+    devices = [modbus_simulator.DeviceImage(library, unit) for unit in (1, 2)]
+    return modbus_simulator.Simulator(devices, latency=[0, 0], baudrate=None, seed=0)
+
+def serve(sim,frames):
+    # Run the RTU loop over the given request frames, return the response frames
+    data, written = list(frames), []
+    sim.serve_rtu(lambda: data.pop(0) if data else b"", written.append)
+    return written
+
+def test_broadcast_read_is_ignored():
+    sim = simulator()
+    read = struct.pack(">BHH", 0x03, 0x0000, 2)
+    written = serve(sim, [frame(0, read), frame(1, read)])
+    # No response to the broadcast, the serve loop goes on with the next frame
+    assert len(written) == 1 and written[0][:2] == bytes([1, 0x03])
+    assert sim.stats["requests"] == 2 and sim.stats["responses"] == 1
+
+def test_broadcast_write_is_applied_to_every_slave():
+    sim = simulator()
+    written = serve(sim, [frame(0, struct.pack(">BHHB2H", 0x10, 0x0000, 2, 4, 0x1234, 0x5678))])
+    assert written == []
+    for device in sim.devices.values():
+        assert device.read(0x03, 0x0000, 2) == [0x1234, 0x5678]
+
+def test_empty_pdu_is_ignored():
+    assert simulator().handle(1, b"") is None
@@ -0,0 +1,67 @@
+"""
+#title           :test_tsdb.py
+#description     :regression tests of the chunk encoding of the local time-series store (large and non-finite values)
+#author          :Nicholas Putra Rihandoko
+#date            :2026/10/18
+#version         :0.1
+#usage           :python3 -m pytest tests
+#notes           :
+#python_version  :3.7.3
+#==============================================================================
+"""
+
+import math
+import time
+import tsdb
+
+def round_trip(values):
+    times = [1700000000000 + 1000*k for k in range(len(values))]
+    t, v = tsdb.decode_chunk(tsdb.encode_chunk(times, values))
+    assert t == times
+    return v
+
+def test_int_mode_round_trip():
+    values = [230.1, 230.4, 229.9, 231.0, -12.5, 0.0]
+    assert round_trip(values) == values
+    assert tsdb.CHUNK.unpack_from(tsdb.encode_chunk([0]*len(values), values))[3] == tsdb.MODE_INT
+
+def test_values_outside_int64_round_trip():
+    for values in ([2.0**70, 1.0, 2.0], [1.0, -2.0**63, 2.0**63], [1e300, -1e300, 0.0], [2.0**53 + 2, 0.5, 1.0]):
+        assert round_trip(values) == values
+
+def test_non_finite_values_round_trip():
+    values = round_trip([1.5, math.inf, -math.inf, math.nan, 2.25])
+    assert values[:3] == [1.5, math.inf, -math.inf] and math.isnan(values[3]) and values[4] == 2.25
+
+def test_store_flushes_non_finite_values(tmp_path):
+    store = tsdb.TimeSeriesStore(str(tmp_path), chunk=4)
+    now = time.time()
+    for k, value in enumerate([1.0, math.inf, 2.0**70, 3.0]): store.append("node/field", now + k, value)
+    assert store.flush() == 1
+    times, values = store.range("node/field", now - 1, now + 10)
+    assert values == [1.0, math.inf, 2.0**70, 3.0]
+
+def test_old_chunk_is_written_before_it_is_full(tmp_path):
+    store = tsdb.TimeSeriesStore(str(tmp_path), chunk=720, age=60)
+    now = time.time()
+    store.append("node/field", now - 120, 1.0)
+    store.append("node/field", now, 2.0)
+    store.append("node/other", now, 3.0)
+    # Only the chunk whose first sample is older than 'age' is written
+    assert store.flush() == 1
+    assert store.months("node/field") and not store.months("node/other")
+
+def test_torn_index_record_is_cut_before_the_next_chunk(tmp_path,capsys):
+    store = tsdb.TimeSeriesStore(str(tmp_path), chunk=2)
+    now = time.time()
+    store.append("node/field", now, 1.0); store.append("node/field", now + 1, 2.0)
+    store.flush()
+    path = store.path("node/field", store.months("node/field")[0])
+    # Power loss while the next index record is written, and a record of a chunk that never reached the .dat file
+    with open(path + ".idx", "ab") as file:
+        file.write(tsdb.INDEX.pack(0, 0, 10**6, 100))
+        file.write(b"\x01\x02\x03")
+    store.append("node/field", now + 2, 3.0); store.append("node/field", now + 3, 4.0)
+    store.flush()
+    assert tsdb.os.path.getsize(path + ".idx") == 2 * tsdb.INDEX.size
+    assert store.range("node/field", now - 1, now + 10)[1] == [1.0, 2.0, 3.0, 4.0]
@@ -0,0 +1,113 @@
+"""
+#title           :test_uploader.py
+#description     :regression tests of the MySQL upload of the outbox (refused rows, lost connection, server errors)
+#author          :Nicholas Putra Rihandoko
+#date            :2026/10/18
+#version         :0.1
+#usage           :python3 -m pytest tests
+#notes           :the MySQL connection is replaced by a fake one, pymysql is only needed for its error classes
+#python_version  :3.7.3
+#==============================================================================
+"""
+
+import pytest
+
+pymysql = pytest.importorskip("pymysql")
+import outbox
+import uploader
+
+QUERY = "INSERT INTO test (a, b) VALUES (%s, %s)"
+
+class Cursor:
+    def __init__(self,db):
+        self.db = db
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        return False
+
+    def executemany(self,query,rows):
+        if self.db.lost: raise pymysql.err.OperationalError(2013, "Lost connection to MySQL server during query")
+        if self.db.error: raise self.db.error
+        # A row with the wrong number of columns is refused by the server, as OperationalError (not ProgrammingError)
+        for row in rows:
+            if len(row) != 2: raise pymysql.err.OperationalError(1136, "Column count doesn't match value count at row 1")
+        self.db.pending.extend(rows)
+
+class Connection:
+    def __init__(self,lost=False,error=None):
+        self.open = True
+        self.lost = lost
+        self.error = error      # error of the server raised for every batch
+        self.pending = []
+        self.rows = []
+
+    def cursor(self):
+        return Cursor(self)
+
+    def commit(self):
+        self.rows.extend(self.pending); self.pending = []
+
+    def rollback(self):
+        self.pending = []
+
+    def ping(self,reconnect=False):
+        pass
+
+    def close(self):
+        self.open = False
+
+def queue(tmp_path):
+    box = outbox.Outbox(str(tmp_path / "outbox.db"))
+    box.put_many(QUERY, [[1, 2], [3, 4], [5], [6, 7]])
+    return box
+
+def test_refused_row_is_moved_aside(tmp_path,capsys):
+    box = queue(tmp_path)
+    db = Connection()
+    upload = uploader.Uploader({}, box)
+    upload._db = db
+    assert upload.flush(force=True) == 3
+    assert box.pending() == 0
+    assert db.rows == [[1, 2], [3, 4], [6, 7]]
+    rejected = box._db.execute("SELECT data, error FROM rejected").fetchall()
+    assert len(rejected) == 1 and rejected[0][0] == "[5]" and "1136" in rejected[0][1]
+    # The connection is kept
+    assert upload._db is db
+
+def test_lost_connection_keeps_the_rows(tmp_path,capsys):
+    box = queue(tmp_path)
+    upload = uploader.Uploader({}, box)
+    upload._db = Connection(lost=True)
+    assert upload.flush(force=True) == 0
+    assert box.pending() == 4
+    assert upload._db is None
+    assert box._db.execute("SELECT COUNT(*) FROM rejected").fetchone()[0] == 0
+
+@pytest.mark.parametrize("error", [pymysql.err.OperationalError(1205, "Lock wait timeout exceeded; try restarting transaction"),
+                                   pymysql.err.OperationalError(1213, "Deadlock found when trying to get lock"),
+                                   pymysql.err.ProgrammingError(1146, "Table 'db.test' doesn't exist"),
+                                   pymysql.err.OperationalError(1142, "INSERT command denied to user"),
+                                   pymysql.err.InternalError(1290, "The MySQL server is running with the --read-only option")])
+def test_server_error_keeps_the_outbox_intact(tmp_path,capsys,error):
+    box = queue(tmp_path)
+    upload = uploader.Uploader({}, box)
+    upload._db = Connection(error=error)
+    assert upload.flush(force=True) == 0
+    assert box.pending() == 4
+    assert box.rejected() == []
+    # The upload waits before the next connection attempt
+    assert upload._db is None and upload.connect() is False
+
+def test_rejected_rows_are_queued_again(tmp_path,capsys):
+    box = queue(tmp_path)
+    upload = uploader.Uploader({}, box)
+    upload._db = Connection()
+    upload.flush(force=True)
+    [(row, query, data, error)] = box.rejected()
+    assert data == [5] and box.pending() == 0
+    assert box.requeue() == 1
+    assert box.rejected() == [] and box.peek(10)[0][1:] == (QUERY, [5])
+    assert box.requeue() == 0